@@ -10,11 +10,19 @@ from quart_jwt_extended import JWTManager, decode_token
 from flask_caching import Cache
 from health.api import api_health
 from proxy.api import api_proxy
+from proxy.cache import media_cache
 from user.api import api_auth
 from user.model import authorized_users
+from user.peers import handle as handle_peer
+from user.ticker import position_ticker
 from world.api import api_world
+from world.shard import shards
 from utils.ws import sending, receiving
+from utils.backplane import LocalTransport, SocketTransport, backplane, broker
+from utils.http import http_client
 from utils.orjson import OrJSONProvider
+from utils.queue import SendQueue
+from utils.timer import scheduler
 from utils.utils import get_secret_key
 
 with open('config.toml', 'rb') as config_file:
@@ -32,6 +40,56 @@ jwt = JWTManager(app)
 app.cache = Cache(app)
 app.json = OrJSONProvider(app)
 
+@app.before_serving
+async def start_ticker():
+    """Start batched position updates"""
+    if config['POSITION_BATCH']:
+        position_ticker.start(config['POSITION_UPDATE_TICK'], config['AOI_NEAR_RADIUS'],
+                              config['AOI_FAR_RADIUS'], config['AOI_FAR_TICKS'])
+
+@app.before_serving
+async def start_http_client():
+    """Open the connection pool to upstreams, and the cache of what they send"""
+    http_client.start(config['HTTP_MAX_CONNECTIONS'], config['HTTP_MAX_PER_HOST'],
+                      config['HTTP2'], config['HTTP_TIMEOUT'])
+    media_cache.open(config['MEDIA_CACHE_PATH'], config['MEDIA_CACHE_SIZE'],
+                     config['MEDIA_CACHE_TTL'])
+
+@app.after_serving
+async def stop_http_client():
+    """Close the connection pool to upstreams"""
+    await http_client.close()
+
+@app.before_serving
+async def start_backplane():
+    """Share users and broadcasts with the other workers"""
+    backplane.subscribe(handle_peer)
+    if config['BACKPLANE'] == 'local':
+        await backplane.start(LocalTransport())
+    elif config['BACKPLANE'] == 'socket':
+        if config['BACKPLANE_BROKER']:
+            try:
+                await broker.start(config['BACKPLANE_HOST'], config['BACKPLANE_PORT'])
+            except OSError:
+                # Already run by another worker
+                pass
+        await backplane.start(SocketTransport(config['BACKPLANE_HOST'], config['BACKPLANE_PORT']))
+    if backplane.active:
+        shards.start(config['SHARD_HEARTBEAT'], config['SHARD_TIMEOUT'], config['SHARD_REBALANCE'])
+
+@app.after_serving
+async def stop_backplane():
+    """Stop sharing with the other workers"""
+    shards.stop()
+    await backplane.stop()
+    await broker.stop()
+
+@app.after_serving
+async def stop_ticker():
+    """Stop batched position updates and periodic jobs"""
+    position_ticker.stop()
+    await scheduler.stop()
+
 @app.route('/')
 async def index():
     """Default route"""
@@ -56,15 +114,33 @@ async def wsocket():
         await websocket.close(code=401, reason='Invalid JWT')
         return
 
-    user = next((user for user in authorized_users if user.auth_id == data['identity']), None)
+    user = authorized_users.get(data['identity'])
     if user is None:
         return
+    if user.queue is None:
+        # Logged in through another worker
+        user.queue = SendQueue(config['SEND_QUEUE_SIZE'], config['SLOW_CONSUMER_TIMEOUT'])
+    user.node = None
+    if not user.websockets:
+        user.queue.resume()
+        # Positions dropped with the queue are sent again
+        user.pos_baselines = {}
     user.websockets.add(websocket._get_current_object())
     user.connected = True
     await user.set_timer()
     producer = asyncio.create_task(sending(user))
     consumer = asyncio.create_task(receiving(user))
-    await asyncio.gather(producer, consumer)
+    watchdog = asyncio.create_task(user.queue.wait_stalled())
+    tasks = (producer, consumer, watchdog)
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+    # Only the watchdog ends without raising: the user can't keep up with its messages
+    await websocket.close(code=1008, reason='Too slow')
 
 @app.errorhandler(404)
 async def redirect(_):
@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 """Health API routes"""
 
-from quart import Blueprint
+from quart import Blueprint, current_app
 from db import db, db_required
+from user.model import authorized_users
+from utils.cache import cache_counters
+from utils.orjson import encode_counters
+from utils.queue import coalesced_counters, dropped_counters, stalled_counter
+from utils.ws import send_counters
 
 api_health = Blueprint('api_health', __name__, url_prefix='/')
 
@@ -33,3 +38,27 @@ async def check_readiness():
             'error': {},
             'details': {'database': {'status': 'down'}}
         }, 503
+
+@api_health.get('/metrics')
+async def metrics():
+    queues = [user.queue for user in authorized_users.connected() if user.node is None]
+    depths = [queue.qsize() for queue in queues]
+    return {
+        'websocket': {
+            'encoded': dict(encode_counters),
+            'sent': dict(send_counters)
+        },
+        'queues': {
+            'full': sum(queue.qsize() >= queue.maxsize for queue in queues),
+            'max_depth': max(depths, default=0),
+            'total_depth': sum(depths),
+            'coalesced': dict(coalesced_counters),
+            'dropped': dict(dropped_counters),
+            'stalled': stalled_counter['stalled']
+        },
+        'cache': {
+            # Only tracked by the in-memory backend
+            'bytes': getattr(current_app.cache.cache, 'size', None),
+            'prefixes': {prefix: dict(counter) for prefix, counter in cache_counters.items()}
+        }
+    }, 200
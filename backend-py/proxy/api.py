@@ -1,59 +1,170 @@
 #!/usr/bin/env python
 """Proxy API routes"""
 
-import httpx
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from quart import Blueprint, current_app, request, Response
+from proxy.cache import media_cache
+from utils.flight import SingleFlight
+from utils.http import http_client
 
 api_proxy = Blueprint('api_proxy', __name__, url_prefix='/api/v1/proxy')
+archive_lookups = SingleFlight()
+
+FORWARDED_REQUEST_HEADERS = ('Range', 'If-Range')
+# Validators of cached media, sent to the upstream once they are stale
+VALIDATORS = (('ETag', 'If-None-Match'), ('Last-Modified', 'If-Modified-Since'))
+FORWARDED_RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Content-Encoding',
+                              'Accept-Ranges', 'ETag', 'Last-Modified', 'Cache-Control')
 
 
 @api_proxy.get('/archive')
 async def media_archive():
     """Get media file from archive"""
-
-    cache = current_app.cache
     url = request.args.get("url")
     date = request.args.get("date") or '199501'
 
+    out = await archive_lookup(url, date)
+    return ({'url': out}, 200) if out else ({}, 404)
+
+
+@api_proxy.post('/archive')
+async def media_archive_bulk():
+    """Get media files from archive, as a map of URLs to archived URLs or null"""
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {'error': 'Expected a JSON object'}, 400
+    urls = data.get('urls') or []
+    date = data.get('date') or '199501'
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls) \
+            or not isinstance(date, str):
+        return {'error': 'Expected a list of URLs and a date string'}, 400
+    urls = list(dict.fromkeys(urls))
+    if len(urls) > current_app.config['ARCHIVE_BULK_MAX']:
+        return {'error': 'Too many URLs'}, 400
+
+    semaphore = asyncio.Semaphore(current_app.config['ARCHIVE_BULK_CONCURRENCY'])
+
+    async def lookup(url):
+        async with semaphore:
+            return await archive_lookup(url, date)
+
+    results = await asyncio.gather(*(lookup(url) for url in urls))
+    return {'urls': {url: out or None for url, out in zip(urls, results)}}, 200
+
+
+async def archive_lookup(url: str, date: str):
+    """Get the archived URL of a media, '' if there is none and None if the lookup failed,
+    concurrent lookups of an URL sharing the same request"""
+    cache = current_app.cache
     # Don't use the date in the cache key
     if (out := cache.get(f"U-{url}")) is not None:
-        return ({'url': out}, 200) if out else ({}, 404)
-    async with httpx.AsyncClient() as client:
+        return out
+    return await archive_lookups.do(f"U-{url}", lambda: _archive_lookup(cache, url, date))
+
+
+async def _archive_lookup(cache, url: str, date: str):
+    try:
+        res = await http_client.get(
+            f'https://archive.org/wayback/available?url={url}&timestamp={date}'
+        )
+    except Exception:
+        return None
+    out = ""
+    if res.status_code == 200:
         try:
-            res = await client.get(
-                f'https://archive.org/wayback/available?url={url}&timestamp={date}',
-                follow_redirects=True,
-                timeout=30
-            )
+            out = res.json()['archived_snapshots']['closest']['url'].replace('/http', 'im_/http')
         except Exception:
-            return {}, 404
-        if res.status_code == 200:
-            try:
-                out = res.json()['archived_snapshots']['closest']['url'].replace('/http', 'im_/http')
-                cache.set(f"U-{url}", out)
-                return {'url': out}, 200
-            except Exception:
-                cache.set(f"U-{url}", "")
-                return {}, 404
-        else:
-            cache.set(f"U-{url}", "")
-
-    return {}, 404
+            pass
+    cache.set(f"U-{url}", out)
+    return out
 
 
 @api_proxy.get('/url')
 async def media_proxy():
-    """Proxy media file"""
-    url = request.args.get("url")
+    """Proxy media file, relaying it as it arrives"""
+    if not (url := request.args.get("url")):
+        return {}, 404
+    return await _proxy(url)
+
+
+async def _proxy(url: str, cached: bool = True):
+    meta = media_cache.get(url) if media_cache.enabled and cached else None
+    if meta is not None and media_cache.fresh(meta):
+        if (response := await _send_cached(url, meta)) is not None:
+            return response
+        meta = None
+
+    if meta is not None:
+        # Stale, ask the upstream whether it changed
+        headers = {header: meta[name] for name, header in VALIDATORS if name in meta}
+    else:
+        headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS
+                   if name in request.headers}
+
+    try:
+        stream = await http_client.stream(url, headers=headers)
+    except Exception:
+        if meta is not None and (response := await _send_cached(url, meta)) is not None:
+            return response
+        return {}, 404
+    res = stream.response
+    if res.status_code == 304 and meta is not None:
+        await stream.aclose()
+        meta = await media_cache.refresh(url, meta, res.headers)
+        if (response := await _send_cached(url, meta)) is not None:
+            return response
+        # Evicted by another worker meanwhile
+        return await _proxy(url, cached=False)
+    if res.status_code not in (200, 206):
+        await stream.aclose()
+        return {}, 404
+
+    body = stream.iter_raw(current_app.config['PROXY_CHUNK'])
+    if media_cache.enabled and res.status_code == 200 \
+            and (writer := media_cache.writer(url, res.headers)) is not None:
+        body = _store(body, writer)
+    # The body is relayed as is, so the encoding and length of the upstream still apply
+    response = Response(body,
+                        status=res.status_code,
+                        headers={name: res.headers[name] for name in FORWARDED_RESPONSE_HEADERS
+                                 if name in res.headers})
+    response.timeout = None
+    return response
+
+
+async def _store(body, writer):
+    """Relay a body while it is written to the cache, which only keeps it if complete"""
+    try:
+        async for chunk in body:
+            await writer.write(chunk)
+            yield chunk
+        await writer.commit()
+    finally:
+        await body.aclose()
+        await writer.discard()
 
-    async with httpx.AsyncClient() as client:
-        try:
-            res = await client.get(url, follow_redirects=True, timeout=30)
-            if res.status_code == 200:
-                return Response(res.content,
-                                content_type=res.headers['content-type'],
-                                status=res.status_code)
-        except Exception:
-            return {}, 404
 
-    return {}, 404
+async def _send_cached(url: str, meta: dict):
+    """Send a cached media, answering conditional and range requests locally, None if it was
+    evicted"""
+    if (body := await media_cache.read(url, meta)) is None:
+        return None
+    max_age = max(0, int(meta['expires'] - time.time()))
+    response = Response(body, mimetype=meta.get('Content-Type', 'application/octet-stream'))
+    response.content_length = meta['size']
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.expires = datetime.now(timezone.utc) + timedelta(seconds=max_age)
+    if 'Last-Modified' in meta:
+        response.last_modified = parsedate_to_datetime(meta['Last-Modified'])
+    if 'ETag' in meta:
+        response.headers['ETag'] = meta['ETag']
+    response = await response.make_conditional(request, accept_ranges=True,
+                                               complete_length=meta['size'])
+    if response.response is not body:
+        # Not modified, the file isn't sent
+        await body.file.close()
+    return response
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""Media cache module"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+import aiofiles
+import aiofiles.os
+import orjson
+from quart.wrappers.response import FileBody
+from utils.cache import WorkerConnection
+
+# Upstream headers kept with cached media
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+# Age in seconds of an unindexed content file before it is removed, not to race with adding it
+ORPHAN_AGE = 3600
+
+
+def expiry(headers, default_ttl: float):
+    """Get when a response stops being fresh from its cache headers, None if it can't be
+    stored"""
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives or 'private' in directives:
+        return None
+    now = time.time()
+    if 'no-cache' in directives:
+        return now
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name, '').isdigit():
+            return now + int(directives[name])
+    if (expires := headers.get('Expires')) is not None:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return now
+    return now + default_ttl
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MediaWriter:
+    """Media being stored while it is relayed, given up if it outgrows the cache"""
+    def __init__(self, cache, url: str, meta: dict) -> None:
+        self.cache = cache
+        self.url = url
+        self.meta = meta
+        self.path = cache.tmp_dir() / uuid.uuid4().hex
+        self._file = None
+        self._hash = hashlib.sha256()
+        self._size = 0
+
+    async def write(self, data: bytes) -> None:
+        if self.path is None:
+            return
+        self._size += len(data)
+        if self._size > self.cache.max_size:
+            await self.discard()
+            return
+        if self._file is None:
+            self._file = await aiofiles.open(self.path, 'wb')
+        await self._file.write(data)
+        self._hash.update(data)
+
+    async def commit(self) -> None:
+        """Add the media to the cache once all of it was written"""
+        if self.path is None:
+            return
+        if self._file is None:
+            self._file = await aiofiles.open(self.path, 'wb')
+        await self._file.close()
+        self._file = None
+        path, self.path = self.path, None
+        await self.cache.add(self.url, path, self._hash.hexdigest(), self._size, self.meta)
+
+    async def discard(self) -> None:
+        """Drop what was written, unless committed"""
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        if self.path is not None:
+            path, self.path = self.path, None
+            if path.exists():
+                await aiofiles.os.remove(path)
+
+
+class MediaBody(FileBody):
+    """Body of a cached media, opened up front so it can be sent even if evicted meanwhile"""
+    def __init__(self, file, size: int) -> None: # pylint: disable=super-init-not-called
+        self.file = file
+        self.size = size
+        self.begin = 0
+        self.end = size
+
+    async def __aenter__(self):
+        await self.file.seek(self.begin)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb) -> None:
+        await self.file.close()
+
+
+class MediaCache:
+    """Proxied media on disk, evicting the least recently used over the size limit
+
+    Files are named after the hash of their content, URLs serving the same bytes sharing the
+    same file. URLs are indexed in a SQLite file, with the upstream validators and freshness of
+    each, which all the workers share to evict for each other. A media evicted by another
+    worker, or left unindexed with the index locked for longer than the busy timeout, is a miss.
+    """
+    def __init__(self) -> None:
+        self.root = None
+        self.max_size = 0
+        self.default_ttl = 0
+        # Hits only record their use when the previous one is older than that
+        self.touch_every = 60
+        self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def open(self, path: str, max_size: int, default_ttl: float,
+             busy_timeout: float = 0.05) -> None:
+        """Load the cache from disk, an empty path disabling it"""
+        if not path:
+            return
+        self.root = Path(path)
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._db = WorkerConnection(self.root / 'index.sqlite3', busy_timeout, (
+            'CREATE TABLE IF NOT EXISTS media (key TEXT PRIMARY KEY, blob TEXT, '
+            'size INTEGER, meta BLOB, used REAL)',
+            'CREATE INDEX IF NOT EXISTS media_used ON media (used)',
+            'CREATE INDEX IF NOT EXISTS media_blob ON media (blob)'))
+        for folder in ('blobs', 'tmp'):
+            (self.root / folder).mkdir(parents=True, exist_ok=True)
+        # Files being written by workers that are gone
+        for leftover in (self.root / 'tmp').iterdir():
+            if leftover.is_file():
+                leftover.unlink(missing_ok=True)
+            elif not leftover.name.isdigit() or not _alive(int(leftover.name)):
+                shutil.rmtree(leftover, ignore_errors=True)
+        try:
+            used = {blob for blob, in self.db.execute('SELECT DISTINCT blob FROM media')}
+            with self.db:
+                self._evict()
+        except sqlite3.OperationalError:
+            return
+        for blob_path in (self.root / 'blobs').iterdir():
+            if blob_path.name not in used and blob_path.stat().st_mtime < time.time() - ORPHAN_AGE:
+                blob_path.unlink(missing_ok=True)
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def tmp_dir(self) -> Path:
+        """Folder of the files this worker is writing"""
+        path = self.root / 'tmp' / str(os.getpid())
+        path.mkdir(exist_ok=True)
+        return path
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def blob_path(self, meta: dict) -> Path:
+        return self.root / 'blobs' / meta['blob']
+
+    def get(self, url: str):
+        """Get the metadata of a cached URL, fresh or not"""
+        key = self.key(url)
+        try:
+            if (row := self.db.execute('SELECT meta, used FROM media WHERE key = ?',
+                                       (key,)).fetchone()) is None:
+                return None
+            if row[1] < (now := time.time()) - self.touch_every:
+                with self.db:
+                    self.db.execute('UPDATE media SET used = ? WHERE key = ?', (now, key))
+        except sqlite3.OperationalError:
+            return None
+        return orjson.loads(row[0]) # pylint: disable=maybe-no-member
+
+    @staticmethod
+    def fresh(meta: dict) -> bool:
+        return meta['expires'] > time.time()
+
+    def writer(self, url: str, headers):
+        """Get a writer to store a response, None if it can't be stored"""
+        length = headers.get('Content-Length', '0').strip()
+        if (expires := expiry(headers, self.default_ttl)) is None \
+                or headers.get('Content-Encoding', 'identity') != 'identity' \
+                or not length.isdigit() or int(length) > self.max_size:
+            return None
+        meta = {'url': url, 'expires': expires}
+        meta.update((name, headers[name]) for name in STORED_HEADERS if name in headers)
+        return MediaWriter(self, url, meta)
+
+    async def read(self, url: str, meta: dict):
+        """Open the content file of a cached media, None if it was evicted"""
+        try:
+            file = await aiofiles.open(self.blob_path(meta), 'rb')
+        except FileNotFoundError:
+            self.forget(url, meta)
+            return None
+        return MediaBody(file, meta['size'])
+
+    async def add(self, url: str, path: Path, blob: str, size: int, meta: dict) -> None:
+        """Add a stored media, its file being moved to the content files"""
+        key = self.key(url)
+        meta = {**meta, 'blob': blob, 'size': size}
+        if await aiofiles.os.path.exists(self.blob_path(meta)):
+            await aiofiles.os.remove(path)
+        else:
+            await aiofiles.os.replace(path, self.blob_path(meta))
+        data = orjson.dumps(meta) # pylint: disable=maybe-no-member
+        try:
+            with self.db:
+                previous = self.db.execute('SELECT blob, size FROM media WHERE key = ?',
+                                           (key,)).fetchone()
+                self.db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?)',
+                                (key, blob, size, data, time.time()))
+                if previous is not None and previous[0] != blob:
+                    self._drop_unused(*previous)
+                self._evict()
+        except sqlite3.OperationalError:
+            # Left unindexed, the content file goes once orphaned for long enough
+            pass
+
+    async def refresh(self, url: str, meta: dict, headers) -> dict:
+        """Renew a cached media after the upstream validated it"""
+        meta = dict(meta)
+        if (expires := expiry(headers, self.default_ttl)) is not None:
+            meta['expires'] = expires
+        meta.update((name, headers[name]) for name in STORED_HEADERS[1:] if name in headers)
+        data = orjson.dumps(meta) # pylint: disable=maybe-no-member
+        try:
+            with self.db:
+                # Unless evicted or replaced meanwhile
+                self.db.execute('UPDATE media SET meta = ?, used = ? WHERE key = ? AND blob = ?',
+                                (data, time.time(), self.key(url), meta['blob']))
+        except sqlite3.OperationalError:
+            pass
+        return meta
+
+    def forget(self, url: str, meta: dict) -> None:
+        """Drop a cached media whose content file is gone"""
+        try:
+            with self.db:
+                self.db.execute('DELETE FROM media WHERE key = ? AND blob = ?',
+                                (self.key(url), meta['blob']))
+        except sqlite3.OperationalError:
+            pass
+
+    def _drop_unused(self, blob: str, size: int) -> int:
+        """Remove a content file no URL uses anymore, returning the size freed"""
+        if self.db.execute('SELECT 1 FROM media WHERE blob = ? LIMIT 1', (blob,)).fetchone():
+            return 0
+        (self.root / 'blobs' / blob).unlink(missing_ok=True)
+        return size
+
+    def _evict(self) -> None:
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM '
+                                '(SELECT MAX(size) AS size FROM media GROUP BY blob)').fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, blob, size in self.db.execute(
+                'SELECT key, blob, size FROM media ORDER BY used').fetchall():
+            if total <= self.max_size:
+                break
+            self.db.execute('DELETE FROM media WHERE key = ?', (key,))
+            total -= self._drop_unused(blob, size)
+
+
+media_cache = MediaCache()
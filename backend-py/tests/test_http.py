@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Shared HTTP client tests"""
+
+import asyncio
+import time
+from tests.upstream import Upstream
+from utils.http import HttpClient
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_connections_are_reused():
+    async def main(upstream):
+        client = HttpClient()
+        client.start(10, 4, False, 5)
+        try:
+            for _ in range(5):
+                res = await client.get(f'{upstream.url}/media')
+                assert res.status_code == 200 and res.content == b'data'
+        finally:
+            await client.close()
+
+    with Upstream() as upstream:
+        upstream.responses['/media'] = (200, {}, b'data')
+        run(main(upstream))
+        assert len(upstream.requests) == 5
+        assert len(set(upstream.ports)) == 1
+
+
+def test_requests_are_limited_per_host():
+    async def main(upstream):
+        client = HttpClient()
+        client.start(10, 2, False, 5)
+        try:
+            results = await asyncio.gather(*(client.get(f'{upstream.url}/media?delay=0.2')
+                                             for _ in range(6)))
+        finally:
+            await client.close()
+        assert all(res.status_code == 200 for res in results)
+
+    with Upstream() as upstream:
+        upstream.responses['/media'] = (200, {}, b'data')
+        run(main(upstream))
+        assert len(upstream.requests) == 6
+        assert upstream.max_active == 2
+
+
+def test_stream_holds_its_slot_until_closed():
+    async def main(upstream):
+        client = HttpClient()
+        client.start(10, 1, False, 5)
+        try:
+            stream = await client.stream(f'{upstream.url}/media')
+            waiting = asyncio.create_task(client.get(f'{upstream.url}/media'))
+            await asyncio.sleep(0.1)
+            assert not waiting.done()
+            assert b''.join([chunk async for chunk in stream.iter_raw(2)]) == b'data'
+            assert (await asyncio.wait_for(waiting, 5)).content == b'data'
+        finally:
+            await client.close()
+
+    with Upstream() as upstream:
+        upstream.responses['/media'] = (200, {}, b'data')
+        run(main(upstream))
+
+
+def test_close_drops_the_pool():
+    async def main(upstream):
+        client = HttpClient()
+        client.start(10, 4, False, 5)
+        await client.get(f'{upstream.url}/media')
+        await client.close()
+        # Started again, as a worker would be
+        client.start(10, 4, False, 5)
+        try:
+            await client.get(f'{upstream.url}/media')
+        finally:
+            await client.close()
+
+    with Upstream() as upstream:
+        upstream.responses['/media'] = (200, {}, b'data')
+        run(main(upstream))
+        deadline = time.monotonic() + 5
+        while upstream.closed < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(set(upstream.ports)) == 2
+        assert upstream.closed == 2
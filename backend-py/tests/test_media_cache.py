@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Media proxy cache tests"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+from quart import Quart
+import proxy.api
+from proxy.cache import MediaCache
+from tests.upstream import Upstream
+from utils.http import HttpClient
+
+MEDIA = (200, {'Content-Type': 'image/png', 'ETag': '"v1"', 'Cache-Control': 'max-age=60'},
+         b'media')
+
+
+def open_cache(path, max_size: int = 2 ** 20) -> MediaCache:
+    cache = MediaCache()
+    cache.open(str(path), max_size, 60)
+    return cache
+
+
+@pytest.fixture(name='upstream')
+def fixture_upstream():
+    with Upstream() as upstream:
+        upstream.responses['/media'] = MEDIA
+        yield upstream
+
+
+@pytest.fixture(name='cache')
+def fixture_cache(tmp_path, monkeypatch):
+    cache = open_cache(tmp_path)
+    monkeypatch.setattr(proxy.api, 'media_cache', cache)
+    monkeypatch.setattr(proxy.api, 'http_client', HttpClient())
+    return cache
+
+
+def fetch(upstream, *requests) -> list:
+    """Proxy (path, headers) requests one after the other, as (status, headers, body)"""
+    app = Quart(__name__)
+    app.config['PROXY_CHUNK'] = 2
+    app.register_blueprint(proxy.api.api_proxy)
+
+    async def main():
+        proxy.api.http_client.start(10, 4, False, 5)
+        client = app.test_client()
+        results = []
+        try:
+            for path, headers in requests:
+                res = await client.get('/api/v1/proxy/url',
+                                       query_string={'url': upstream.url + path}, headers=headers)
+                results.append((res.status_code, res.headers, await res.get_data()))
+        finally:
+            await proxy.api.http_client.close()
+        return results
+
+    return asyncio.run(main())
+
+
+def test_fresh_media_is_served_from_disk(upstream, cache):
+    results = fetch(upstream, ('/media', {}), ('/media', {}))
+    assert [(status, body) for status, _, body in results] == [(200, b'media')] * 2
+    assert results[1][1]['ETag'] == '"v1"'
+    assert len(upstream.requests) == 1
+    assert cache.get(upstream.url + '/media')['size'] == 5
+
+
+def test_cached_media_answers_ranges_and_validators(upstream, cache):
+    results = fetch(upstream, ('/media', {}), ('/media', {'Range': 'bytes=1-2'}),
+                    ('/media', {'If-None-Match': '"v1"'}))
+    assert [(status, body) for status, _, body in results[1:]] == [(206, b'ed'), (304, b'')]
+    assert len(upstream.requests) == 1
+
+
+def test_stale_media_is_revalidated(upstream, cache):
+    upstream.responses['/media'] = (200, {**MEDIA[1], 'Cache-Control': 'max-age=0'}, b'media')
+    fetch(upstream, ('/media', {}))
+    upstream.responses['/media'] = (304, {'ETag': '"v1"', 'Cache-Control': 'max-age=60'}, b'')
+    results = fetch(upstream, ('/media', {}), ('/media', {}))
+    assert [(status, body) for status, _, body in results] == [(200, b'media')] * 2
+    assert upstream.requests[1][1]['If-None-Match'] == '"v1"'
+    # Fresh again after the 304
+    assert len(upstream.requests) == 2
+
+
+def test_no_store_is_not_cached(upstream, cache):
+    upstream.responses['/media'] = (200, {'Cache-Control': 'no-store'}, b'media')
+    fetch(upstream, ('/media', {}), ('/media', {}))
+    assert len(upstream.requests) == 2
+    assert cache.get(upstream.url + '/media') is None
+
+
+@pytest.mark.parametrize('max_age', [60, 0])
+def test_missing_file_is_a_miss(upstream, cache, max_age):
+    upstream.responses['/media'] = (200, {**MEDIA[1], 'Cache-Control': f'max-age={max_age}'},
+                                    b'media')
+    fetch(upstream, ('/media', {}))
+    for blob in (cache.root / 'blobs').iterdir():
+        blob.unlink()
+    # A stale entry gets a 304 from the upstream first
+    upstream.responses['/media'] = lambda headers: (304, {}, b'') \
+        if headers.get('If-None-Match') == '"v1"' else MEDIA
+    results = fetch(upstream, ('/media', {}), ('/media', {}))
+    assert [(status, body) for status, _, body in results] == [(200, b'media')] * 2
+    assert len(upstream.requests) == (3 if max_age == 0 else 2)
+
+
+def test_workers_share_the_index(upstream, cache, tmp_path, monkeypatch):
+    other = open_cache(tmp_path)
+    fetch(upstream, ('/media', {}))
+    assert other.get(upstream.url + '/media') == cache.get(upstream.url + '/media')
+    # Bodies with the same content share a file
+    monkeypatch.setattr(proxy.api, 'media_cache', other)
+    upstream.responses['/copy'] = MEDIA
+    fetch(upstream, ('/copy', {}))
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+
+
+def test_eviction_is_shared(upstream, cache, tmp_path, monkeypatch):
+    cache.max_size = 8
+    other = open_cache(tmp_path, 8)
+    upstream.responses['/other'] = MEDIA[:2] + (b'other',)
+    fetch(upstream, ('/media', {}))
+    monkeypatch.setattr(proxy.api, 'media_cache', other)
+    fetch(upstream, ('/other', {}))
+    assert cache.get(upstream.url + '/media') is None
+    monkeypatch.setattr(proxy.api, 'media_cache', cache)
+    results = fetch(upstream, ('/media', {}))
+    assert results[0][0] == 200 and results[0][2] == b'media'
+    assert sum(blob.stat().st_size for blob in (tmp_path / 'blobs').iterdir()) <= 8
+
+
+def test_media_evicted_while_sent_is_sent_whole(upstream, cache):
+    fetch(upstream, ('/media', {}))
+    url = upstream.url + '/media'
+
+    async def main():
+        body = await cache.read(url, cache.get(url))
+        for blob in (cache.root / 'blobs').iterdir():
+            blob.unlink()
+        async with body:
+            return b''.join([chunk async for chunk in body])
+
+    assert asyncio.run(main()) == b'media'
+
+
+def test_leftovers_of_gone_workers_are_removed(tmp_path):
+    gone = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                          capture_output=True, check=True).stdout.decode().strip()
+    for pid in (str(os.getpid()), gone):
+        (tmp_path / 'tmp' / pid).mkdir(parents=True)
+        (tmp_path / 'tmp' / pid / 'partial').write_bytes(b'data')
+    (tmp_path / 'tmp' / 'partial').write_bytes(b'data')
+    open_cache(tmp_path)
+    assert [path.name for path in (tmp_path / 'tmp').iterdir()] == [str(os.getpid())]
+
+
+def test_missing_url_is_not_found(upstream, cache):
+    app = Quart(__name__)
+    app.register_blueprint(proxy.api.api_proxy)
+
+    async def main():
+        client = app.test_client()
+        return [(await client.get('/api/v1/proxy/url', query_string=query)).status_code
+                for query in ({}, {'url': ''})]
+
+    assert asyncio.run(main()) == [404, 404]
+
+
+@pytest.mark.parametrize('length', ['bad', '', '-1'])
+def test_bad_length_is_not_cached(cache, length):
+    assert cache.writer('http://media', {'Content-Length': length}) is None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Local stand-in upstream for the proxy tests"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Upstream(ThreadingHTTPServer):
+    """HTTP server on a thread, serving set responses and recording what it gets
+
+    Responses are (status, headers, body) by path, or functions of the request headers giving
+    them, a 'delay' query parameter holding them back for that many seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), UpstreamHandler)
+        self.responses = {}
+        self.requests = []
+        self.ports = []
+        self.closed = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Handler of the stand-in upstream, keeping connections alive"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None: # pylint: disable=invalid-name
+        server = self.server
+        path, _, query = self.path.partition('?')
+        with server._lock:
+            server.requests.append((path, dict(self.headers)))
+            server.ports.append(self.client_address[1])
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            params = dict(pair.partition('=')[::2] for pair in query.split('&') if pair)
+            time.sleep(float(params.get('delay', 0)))
+            response = server.responses.get(path, (404, {}, b''))
+            status, headers, body = response(self.headers) if callable(response) else response
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if status != 304:
+                self.wfile.write(body)
+        finally:
+            with server._lock:
+                server.active -= 1
+
+    def finish(self) -> None:
+        super().finish()
+        with self.server._lock:
+            self.server.closed += 1
+
+    def log_message(self, *args) -> None:
+        pass
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Measure the cost of one position tick of broadcast_world, against a full scan of all users"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from user.model import User, authorized_users, broadcast_world  # pylint: disable=wrong-import-position
+
+# (total users, users per world)
+SCENARIOS = ((1000, 10), (1000, 100), (1000, 1000), (5000, 10), (5000, 100), (5000, 1000))
+TICKS = 3
+
+
+class NullQueue:
+    """Queue dropping everything"""
+    async def put(self, _):
+        pass
+
+
+async def broadcast_world_scan(world, message):
+    """broadcast_world as a scan of every authorized user"""
+    for user in [u for u in authorized_users if u.connected and u.world == world]:
+        if message['type'] == 'pos' and message['user'] == user.auth_id:
+            continue
+        await user.queue.put(message)
+
+
+def populate(total, per_world):
+    for user in list(authorized_users):
+        authorized_users.discard(user)
+    users = []
+    for i in range(total):
+        user = User(str(i))
+        user.queue = NullQueue()
+        authorized_users.add(user)
+        user.connected = True
+        user.world = i // per_world
+        users.append(user)
+    return users
+
+
+async def tick(users, func):
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        for user in users:
+            await func(user.world, {'type': 'pos', 'user': user.auth_id, 'data': {}})
+    return (time.perf_counter() - start) / TICKS
+
+
+async def main():
+    print(f"{'users':>6} {'per world':>10} {'scan ms/tick':>13} {'presence ms/tick':>17} {'speedup':>8}")
+    for total, per_world in SCENARIOS:
+        users = populate(total, per_world)
+        scan = await tick(users, broadcast_world_scan)
+        presence = await tick(users, broadcast_world)
+        print(f'{total:>6} {per_world:>10} {scan * 1e3:>13.1f} {presence * 1e3:>17.1f} '
+              f'{scan / presence:>7.1f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
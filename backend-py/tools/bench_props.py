@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Compare props box queries between SQLite (as issued by Prisma) and the spatial grid"""
+
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from world.grid import PropGrid  # pylint: disable=wrong-import-position
+
+SIZES = (10_000, 100_000, 1_000_000)
+QUERIES = 200
+CELL = 2000
+# Props are spread like a dense world: 1 km around the origin, in centimeters
+SPREAD = 100_000
+# One client chunk
+BOX = 2000
+
+
+def make_props(count):
+    rand = random.Random(count)
+    return [
+        (i, 1, 'wall01.rwx', rand.randrange(-SPREAD, SPREAD), rand.randrange(-500, 500),
+         rand.randrange(-SPREAD, SPREAD), 0, 0, 0, None, None)
+        for i in range(1, count + 1)
+    ]
+
+
+def make_boxes():
+    rand = random.Random(0)
+    boxes = []
+    for _ in range(QUERIES):
+        x = rand.randrange(-SPREAD, SPREAD)
+        z = rand.randrange(-SPREAD, SPREAD)
+        boxes.append((x, x + BOX, z, z + BOX))
+    return boxes
+
+
+def bench_sqlite(props, boxes):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE prop (id INTEGER PRIMARY KEY, wid INTEGER, date INTEGER, name TEXT, '
+                 'x INTEGER, y INTEGER, z INTEGER, pi INTEGER, ya INTEGER, ro INTEGER, '
+                 'desc TEXT, act TEXT)')
+    conn.execute('CREATE INDEX prop_x_idx ON prop(x)')
+    conn.execute('CREATE INDEX prop_z_idx ON prop(z)')
+    conn.executemany('INSERT INTO prop VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', props)
+    conn.execute('ANALYZE')
+    # Same shape as the query built by World.props
+    query = ('SELECT id, date, name, x, y, z, pi, ya, ro, desc, act FROM prop '
+             'WHERE wid = ? AND (x >= ? AND x < ? AND z >= ? AND z < ?)')
+    start = time.perf_counter()
+    found = 0
+    for min_x, max_x, min_z, max_z in boxes:
+        found += len([list(row) for row in conn.execute(query, (1, min_x, max_x, min_z, max_z))])
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed, found
+
+
+def bench_grid(props, boxes):
+    start = time.perf_counter()
+    grid = PropGrid(CELL)
+    for prop in props:
+        grid.add(list(prop))
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    found = 0
+    for min_x, max_x, min_z, max_z in boxes:
+        found += len(grid.query(min_x, max_x, None, None, min_z, max_z))
+    return build, time.perf_counter() - start, found
+
+
+def main():
+    boxes = make_boxes()
+    print(f'{QUERIES} queries of {BOX}x{BOX}, cell size {CELL}')
+    print(f"{'props':>10} {'sqlite ms/q':>12} {'grid ms/q':>10} {'grid build s':>13} {'speedup':>8}")
+    for size in SIZES:
+        props = make_props(size)
+        sql_time, sql_found = bench_sqlite(props, boxes)
+        build, grid_time, grid_found = bench_grid(props, boxes)
+        assert sql_found == grid_found, (sql_found, grid_found)
+        print(f'{size:>10} {sql_time / QUERIES * 1e3:>12.3f} {grid_time / QUERIES * 1e3:>10.3f} '
+              f'{build:>13.2f} {sql_time / grid_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""Measure the event loop overhead of per-user position timers, chained Timer against Scheduler"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.timer import Scheduler  # pylint: disable=wrong-import-position
+
+USERS = (1000, 10_000)
+TICK = 0.2
+DURATION = 3
+
+
+class Timer:
+    """Timer the users used to chain, one task per run"""
+    def __init__(self, timeout: float, callback) -> None:
+        self._timeout = timeout
+        self._callback = callback
+        self._task = None
+
+    async def start(self) -> None:
+        """Start timer"""
+        await asyncio.sleep(self._timeout)
+        self._task = asyncio.ensure_future(self._callback())
+
+    async def cancel(self) -> None:
+        """Stop timer"""
+        if not self._task:
+            return
+        if not self._task.done():
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+
+class ChainedUser:
+    """Previous User timer: every run starts a new Timer from the callback"""
+    def __init__(self, counter):
+        self.counter = counter
+        self.timer = None
+        self.running = True
+
+    async def set_timer(self):
+        if self.timer:
+            await self.timer.cancel()
+        if self.running:
+            self.timer = Timer(TICK, self.send_pos)
+            await self.timer.start()
+
+    async def send_pos(self):
+        self.counter[0] += 1
+        await self.set_timer()
+
+
+async def run_chained(count):
+    counter = [0]
+    users = [ChainedUser(counter) for _ in range(count)]
+    tasks = [asyncio.create_task(user.set_timer()) for user in users]
+    await asyncio.sleep(DURATION)
+    for user in users:
+        user.running = False
+    await asyncio.sleep(TICK * 2)
+    for task in tasks:
+        task.cancel()
+    return counter[0]
+
+
+async def run_scheduler(count):
+    counter = [0]
+    scheduler = Scheduler()
+
+    async def send_pos():
+        counter[0] += 1
+
+    jobs = [scheduler.schedule(TICK, send_pos) for _ in range(count)]
+    await asyncio.sleep(DURATION)
+    for job in jobs:
+        job.cancel()
+    await scheduler.stop()
+    return counter[0]
+
+
+def measure(func, count):
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    runs = asyncio.run(func(count))
+    return time.process_time() - start_cpu, time.perf_counter() - start, runs
+
+
+def main():
+    print(f'{DURATION}s at a {TICK}s tick, CPU time spent by the event loop')
+    print(f"{'users':>6} {'mode':>10} {'runs':>8} {'cpu s':>7} {'cpu us/run':>11} {'load':>6}")
+    for count in USERS:
+        for name, func in (('timer', run_chained), ('scheduler', run_scheduler)):
+            cpu, wall, runs = measure(func, count)
+            print(f'{count:>6} {name:>10} {runs:>8} {cpu:>7.2f} {cpu / runs * 1e6:>11.1f} '
+                  f'{cpu / wall:>6.0%}')
+
+
+if __name__ == '__main__':
+    main()
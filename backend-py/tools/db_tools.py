@@ -4,9 +4,18 @@ Database import and export tools module
 """
 
 import json
+import os
+import sys
+from collections import namedtuple
 import aiofiles
+from prisma import Base64
 from db import db, db_required
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from world.terrain import decode_page, pack_page  # pylint: disable=wrong-import-position
+
+Elev = namedtuple('Elev', ['node_x', 'node_z', 'radius', 'textures', 'heights'])
+
 # atdump v1
 world_attr = {
     0: 'name',
@@ -230,7 +239,16 @@ async def parse_atdump(attr_file):
 
 
 @db_required
-async def import_world(world_name, path='../dumps'):
+async def import_world(world_name, path='../dumps', terrain_pages=False):
+    """
+    Asynchronously import a world from its dump files, overwriting any existing data.
+
+    Args:
+        world_name (str): The name of the world to be imported.
+        path (str, optional): The path of the dump files. Defaults to '../dumps'.
+        terrain_pages (bool, optional): Also store every terrain page fully built, so serving
+            one is a single lookup. Defaults to False.
+    """
     admin = await db.user.find_first(
         where={
             'name': 'admin'
@@ -266,15 +284,24 @@ async def import_world(world_name, path='../dumps'):
         'wid': world.id
     })
 
+    await db.terrain.delete_many(where={
+        'wid': world.id
+    })
+
+    pages = {}
+
     await db.query_raw('BEGIN TRANSACTION')
 
     async for e in load_elevdump(f'{path}/elev{world_name}.txt'):
+        textures = ' '.join(str(n) for n in e[5])
+        heights = ' '.join(str(n) for n in e[6])
         await db.query_raw(
             ('INSERT INTO elev (wid, page_x, page_z, node_x, node_z, radius, textures, heights) '
              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'),
-            world.id, e[0], e[1], e[2], e[3], e[4], ' '.join(str(n) for n in e[5]),
-            ' '.join(str(n) for n in e[6])
+            world.id, e[0], e[1], e[2], e[3], e[4], textures, heights
         )
+        if terrain_pages:
+            pages.setdefault((e[0], e[1]), []).append(Elev(e[2], e[3], e[4], textures, heights))
 
     async for o in load_propdump(f'{path}/prop{world_name}.txt'):
         await db.query_raw(
@@ -285,6 +312,13 @@ async def import_world(world_name, path='../dumps'):
 
     await db.query_raw('COMMIT')
 
+    async with db.batch_() as batcher:
+        for (page_x, page_z), elevs in pages.items():
+            batcher.terrain.create({
+                'wid': world.id, 'page_x': page_x, 'page_z': page_z,
+                'data': Base64.encode(pack_page(*decode_page(elevs)))
+            })
+
 
 async def export_world(world_name, path='../dumps'):
     """
@@ -5,4 +5,4 @@
 import asyncio
 from db_tools import import_world
 
-asyncio.run(import_world('lemuria'))
+asyncio.run(import_world('lemuria', terrain_pages=True))
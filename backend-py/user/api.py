@@ -2,8 +2,7 @@
 """User API routes"""
 
 import uuid
-import asyncio
-from quart import request, jsonify, Blueprint
+from quart import current_app, request, jsonify, Blueprint
 from quart_jwt_extended import (
     create_access_token,
     jwt_refresh_token_required,
@@ -14,7 +13,8 @@ from quart_jwt_extended import (
     jwt_required,
     unset_jwt_cookies
 )
-from user.model import User, authorized_users
+from user.model import User, authorized_users, publish_user
+from utils.queue import SendQueue
 
 api_auth = Blueprint('api_auth', __name__, url_prefix='/api/v1/auth')
 
@@ -25,8 +25,10 @@ async def auth_login():
     user_id = str(uuid.uuid4())[:8]
     user = User(user_id)
     user._name = data['login'] or f'Anonymous{user_id}'
-    user.queue = asyncio.Queue()
+    user.queue = SendQueue(current_app.config['SEND_QUEUE_SIZE'],
+                           current_app.config['SLOW_CONSUMER_TIMEOUT'])
     authorized_users.add(user)
+    await publish_user(user)
     access_token = create_access_token(identity=user_id)
     refresh_token = create_refresh_token(identity=user_id)
 
@@ -46,9 +48,7 @@ async def auth_logout():
 @jwt_required
 async def auth_session():
     """User session"""
-    if curr_user := next(
-        (user for user in authorized_users if user.auth_id == get_jwt_identity()),
-    None):
+    if curr_user := authorized_users.get(get_jwt_identity()):
         return {'id': curr_user.auth_id, 'name': await curr_user.name}, 200
     return {}, 401
 
@@ -56,9 +56,7 @@ async def auth_session():
 @jwt_refresh_token_required
 async def auth_renew():
     """User token renewal"""
-    if curr_user := next(
-        (user for user in authorized_users if user.auth_id == get_jwt_identity()),
-    None):
+    if curr_user := authorized_users.get(get_jwt_identity()):
         access_token = create_access_token(identity=curr_user.auth_id)
         resp = jsonify({'id': curr_user.auth_id, 'name': await curr_user.name})
         set_access_cookies(resp, access_token)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""Interest management module"""
+
+
+class UserGrid:
+    """Users hashed into square cells on X and Z"""
+    def __init__(self, cell_size: float, users) -> None:
+        self.cell_size = cell_size
+        self._cells = {}
+        for user in users:
+            self._cells.setdefault(self._cell(user), []).append(user)
+
+    def _cell(self, user) -> tuple:
+        return (int(user.position[0] // self.cell_size), int(user.position[2] // self.cell_size))
+
+    def around(self, user):
+        """Yield (other user, squared distance) for every user in the cells next to the user,
+        which covers at least a radius of one cell"""
+        cell_x, cell_z = self._cell(user)
+        x, z = user.position[0], user.position[2]
+        for near_x in (cell_x - 1, cell_x, cell_x + 1):
+            for near_z in (cell_z - 1, cell_z, cell_z + 1):
+                for other in self._cells.get((near_x, near_z), ()):
+                    yield other, (other.position[0] - x) ** 2 + (other.position[2] - z) ** 2
@@ -2,52 +2,221 @@
 """User module"""
 
 from quart import current_app
-from utils.timer import Timer
+from utils.backplane import backplane
+from utils.orjson import Frame
+from utils.timer import scheduler
 
-authorized_users = set()
 
-async def broadcast(message):
-    for user in [u for u in authorized_users if u.connected]:
-        await user.queue.put(message)
+class UserRegistry:
+    """Authorized users, indexed by auth id and the connected ones by world"""
+    def __init__(self):
+        self._by_id = {}
+        self._connected = set()
+        # Connected users by world
+        self._present = {}
 
-async def broadcast_world(world, message):
-    for user in [u for u in authorized_users if u.connected and u.world == world]:
-        if message['type'] == 'pos' and message['user'] == user.auth_id:
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, user):
+        return self._by_id.get(user.auth_id) is user
+
+    def add(self, user):
+        """Register a user, replacing any user with the same auth id"""
+        if (previous := self._by_id.get(user.auth_id)) is not None:
+            self.discard(previous)
+        self._by_id[user.auth_id] = user
+        if user.connected:
+            self._connected.add(user)
+            self._present.setdefault(user.world, set()).add(user)
+
+    def discard(self, user):
+        """Unregister a user if it is registered"""
+        if user not in self:
+            return
+        del self._by_id[user.auth_id]
+        self._remove_from(self._present, user, user.world)
+        self._connected.discard(user)
+
+    def get(self, auth_id):
+        """Get a user by auth id"""
+        return self._by_id.get(auth_id)
+
+    def connected(self):
+        """Get the connected users"""
+        return list(self._connected)
+
+    def worlds(self):
+        """Get the worlds with connected users"""
+        return list(self._present)
+
+    def present(self, world):
+        """Get the connected users in a world"""
+        return list(self._present.get(world, ()))
+
+    def present_count(self, world):
+        """Count the connected users in a world"""
+        return len(self._present.get(world, ()))
+
+    def update_world(self, user, old_world, world):
+        """Move a user to another world index"""
+        if user not in self or not user.connected:
+            return
+        self._remove_from(self._present, user, old_world)
+        self._present.setdefault(world, set()).add(user)
+
+    def update_connected(self, user):
+        """Follow the connection state of a user"""
+        if user not in self:
+            return
+        if user.connected:
+            self._connected.add(user)
+            self._present.setdefault(user.world, set()).add(user)
+        else:
+            self._connected.discard(user)
+            self._remove_from(self._present, user, user.world)
+
+    @staticmethod
+    def _remove_from(index, user, world):
+        if (users := index.get(world)) is not None:
+            users.discard(user)
+            if not users:
+                del index[world]
+
+
+authorized_users = UserRegistry()
+
+async def broadcast(message, publish=True):
+    frame = Frame(message)
+    for user in authorized_users.connected():
+        if user.node is None:
+            await user.queue.put(frame)
+    if publish:
+        await backplane.publish({'op': 'broadcast', 'message': message})
+
+async def broadcast_world(world, message, publish=True):
+    frame = Frame(message)
+    for user in authorized_users.present(world):
+        if user.node is not None or (message['type'] == 'pos' and message['user'] == user.auth_id):
             continue
-        await user.queue.put(message)
+        await user.queue.put(frame)
+    if publish:
+        await backplane.publish({'op': 'broadcast', 'world': world, 'message': message})
+
+async def publish_user(user):
+    """Share the state of a user with the other workers"""
+    await backplane.publish({'op': 'user',
+                             'data': {**await user.to_dict(), 'connected': user.connected}})
+
+
+class UserList:
+    """Versioned list of connected users, broadcast whole or as diffs
 
-async def broadcast_userlist():
-    await broadcast({'type': 'list',
-                     'data': [await u.to_dict() for u in [u for u in authorized_users if u.connected]]})
+    Diffs are sequenced: a client applies them on top of the last full list it got, and asks
+    for a new one when it misses a sequence number.
+    """
+    def __init__(self):
+        self.seq = 0
+
+    async def snapshot(self):
+        return {'type': 'list', 'seq': self.seq,
+                'data': [await u.to_dict() for u in authorized_users.connected()]}
+
+    async def send(self, user):
+        """Send the full list to a single user"""
+        await user.queue.put(Frame(await self.snapshot()))
+
+    async def update(self, added=(), removed=(), changed=(), publish=True):
+        """Let all connected users know about a change, each worker keeping its own sequence"""
+        self.seq += 1
+        if publish:
+            for user in (*added, *removed, *changed):
+                await publish_user(user)
+        if not current_app.config['USERLIST_DIFF']:
+            await broadcast(await self.snapshot(), publish=False)
+            return
+        await broadcast({
+            'type': 'list_diff', 'seq': self.seq,
+            'added': [await u.to_dict() for u in added],
+            'removed': [u.auth_id for u in removed],
+            'changed': [await u.to_dict() for u in changed]
+        }, publish=False)
+
+    async def connect(self, user):
+        await self.update(added=[user])
+        if current_app.config['USERLIST_DIFF']:
+            # Diffs already queued for the user are older than this list
+            await self.send(user)
+        await user.send_present_pos()
+
+    async def disconnect(self, user):
+        await self.update(removed=[user])
+
+
+userlist = UserList()
+
+
+# Fields of User.pos_state, as (group, key) in position messages
+POS_FIELDS = (('pos', 'x'), ('pos', 'y'), ('pos', 'z'), ('ori', 'x'), ('ori', 'y'), ('ori', 'z'),
+              ('state', None), ('gesture', None))
 
 
 class User:
     """User class"""
     @staticmethod
     def get(uid):
-        return next((user for user in authorized_users if user.auth_id == uid), None)
+        return authorized_users.get(uid)
 
     def __init__(self, auth_id):
         self.auth_id = auth_id
         self._resolved = False
         self._name = None
         self.queue = None
-        self.connected = False
+        # Worker holding the connection of the user, None for this one
+        self.node = None
+        self._connected = False
         self.websockets = set()
         self.position = [0, 0, 0]
         self.orientation = [0, 0, 0]
         self.avatar = 0
         self.state = 'idle'
         self.gesture = None
-        self.world = 0
+        self._world = 0
         self.pos_timer = None
+        # Position changed since the last batch, and since the last batch for far users
+        self.pos_dirty = True
+        self.far_dirty = True
+        # Position states last sent to near and far users, None when nothing was sent yet
+        self.sent_state = None
+        self.far_sent_state = None
+        # Position states last sent to this user, by auth id, with interest management
+        self.pos_baselines = {}
 
     async def _resolve(self):
-        if not self._resolved:
-            for user in authorized_users:
-                if user.auth_id == self.auth_id:
-                    self._name = user._name
-                    self._resolved = True
+        if not self._resolved and (user := authorized_users.get(self.auth_id)) is not None:
+            self._name = user._name
+            self._resolved = True
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @connected.setter
+    def connected(self, connected):
+        self._connected = connected
+        authorized_users.update_connected(self)
+
+    @property
+    def world(self):
+        return self._world
+
+    @world.setter
+    def world(self, world):
+        authorized_users.update_world(self, self._world, world)
+        self._world = world
 
     @property
     async def name(self):
@@ -71,26 +240,75 @@ class User:
         }
 
     async def set_world(self, world_id):
+        if self.node is not None:
+            # Connected to another worker, which has the say on its state
+            await backplane.publish({'op': 'world', 'user': self.auth_id, 'world': world_id})
+            return
         self.world = world_id
-        await broadcast_userlist()
+        self.sent_state = self.far_sent_state = None
+        self.pos_baselines = {}
+        self.mark_moved()
+        await userlist.update(changed=[self])
+        await self.send_present_pos()
 
     async def set_timer(self):
         if self.pos_timer:
-            await self.pos_timer.cancel()
-        if self.connected:
-            self.pos_timer = Timer(current_app.config['POSITION_UPDATE_TICK'], self.send_pos)
-            await self.pos_timer.start()
+            self.pos_timer.cancel()
+            self.pos_timer = None
+        if self.connected and not current_app.config['POSITION_BATCH']:
+            self.pos_timer = scheduler.schedule(current_app.config['POSITION_UPDATE_TICK'],
+                                                self.send_pos)
+
+    def mark_moved(self):
+        self.pos_dirty = self.far_dirty = True
+
+    def pos_data(self):
+        return {'pos': {'x': self.position[0], 'y': self.position[1], 'z': self.position[2]},
+                'ori': {'x': self.orientation[0],
+                        'y': self.orientation[1],
+                        'z': self.orientation[2]},
+                'state': self.state, 'gesture': self.gesture}
+
+    def pos_state(self):
+        """Position fields as a flat tuple, in the order of POS_FIELDS"""
+        return (*self.position, *self.orientation, self.state, self.gesture)
+
+    def pos_entry(self, since=None, state=None):
+        """Position data tagged with the user, as sent in a pos_batch, only holding the fields
+        of a pos_state (the current one by default) that changed since a previous one (all of
+        them without one)"""
+        entry = {'user': self.auth_id}
+        for (group, key), value, previous in zip(POS_FIELDS, state or self.pos_state(),
+                                                 since or [object()] * len(POS_FIELDS)):
+            if value == previous:
+                continue
+            if key is None:
+                entry[group] = value
+            else:
+                entry.setdefault(group, {})[key] = value
+        return entry
 
     async def send_pos(self):
-        await broadcast_world(self.world, {
-            'type': 'pos', 'user': self.auth_id,
-            'data': {'pos': {'x': self.position[0], 'y': self.position[1], 'z': self.position[2]},
-                     'ori': {'x': self.orientation[0],
-                             'y': self.orientation[1],
-                             'z': self.orientation[2]},
-                     'state': self.state, 'gesture': self.gesture}
-            })
-        await self.set_timer()
+        if self.pos_dirty:
+            self.pos_dirty = False
+            await broadcast_world(self.world, {'type': 'pos', 'user': self.auth_id,
+                                               'data': self.pos_data()})
+
+    async def send_present_pos(self):
+        """Send the full position of everyone in the world of this user, positions only being
+        sent again when they change"""
+        others = [user for user in authorized_users.present(self.world) if user is not self]
+        if self.queue is None or not others:
+            return
+        if not current_app.config['POSITION_BATCH']:
+            for user in others:
+                await self.queue.put(Frame({'type': 'pos', 'user': user.auth_id,
+                                            'data': user.pos_data()}))
+            return
+        # Later entries only hold what changed since these
+        self.pos_baselines = {user.auth_id: user.pos_state() for user in others}
+        await self.queue.put(Frame({'type': 'pos_batch',
+                                    'data': [user.pos_entry() for user in others]}))
 
     async def send_avatar(self):
         await broadcast({'type': 'avatar', 'user': self.auth_id, 'data': self.avatar})
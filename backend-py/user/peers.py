@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Peers module, sharing users with the other workers through the backplane
+
+Users connected to other workers are kept as replicas, tagged with the node of their worker:
+they are part of the user list and of the positions sent, but never get anything queued.
+"""
+
+from user.model import User, authorized_users, broadcast, broadcast_world, publish_user, userlist
+from user.ticker import position_ticker
+from utils.backplane import backplane
+from world.shard import shards
+
+
+async def handle(message: dict) -> None:
+    """Handle a message from another worker"""
+    if message['op'] == 'broadcast':
+        await _on_broadcast(message)
+    elif message['op'] == 'user':
+        await _on_user(message)
+    elif message['op'] == 'world':
+        # Entering a world through a request that landed on another worker
+        if (user := authorized_users.get(message['user'])) is not None and user.node is None:
+            await user.set_world(message['world'])
+    elif message['op'] == 'moves':
+        _on_moves(message)
+    elif message['op'] == 'tick':
+        await position_ticker.deliver(message['world'], message['data'], message['far_tick'])
+    elif message['op'] == 'shard':
+        shards.on_heartbeat(message['node'], message['load'], message['overrides'])
+    elif message['op'] == 'shard_move':
+        shards.on_move(message['world'], message['target'])
+    elif message['op'] == 'connected':
+        # Ask the other workers for their users, and tell them about ours
+        await backplane.publish({'op': 'hello'})
+        await publish_users()
+    elif message['op'] == 'hello':
+        await publish_users()
+
+
+async def publish_users() -> None:
+    """Share the state of all the users of this worker"""
+    for user in authorized_users:
+        if user.node is None:
+            await publish_user(user)
+
+
+async def _on_broadcast(message: dict) -> None:
+    data = message['message']
+    replica = authorized_users.get(data.get('user'))
+    if replica is not None and replica.node is not None:
+        if data['type'] == 'pos':
+            _apply_pos(replica, data['data'])
+        elif data['type'] == 'avatar':
+            replica.avatar = data['data']
+    if 'world' in message:
+        await broadcast_world(message['world'], data, publish=False)
+    else:
+        await broadcast(data, publish=False)
+
+
+async def _on_user(message: dict) -> None:
+    data = message['data']
+    user = authorized_users.get(data['id'])
+    if user is None:
+        user = User(data['id'])
+        user.node = message['node']
+        authorized_users.add(user)
+    elif user.websockets:
+        # Connected here as well, this worker has the say
+        return
+    user.node = message['node']
+    was_connected = user.connected
+    listed = (user._name, user.avatar, user.world)
+    user._name = data['name']
+    user.avatar = data['avatar']
+    user.state = data['state']
+    user.gesture = data['gesture']
+    user.position[:] = data['x'], data['y'], data['z']
+    user.orientation[:] = data['roll'], data['yaw'], data['pitch']
+    if user.world != data['world']:
+        user.world = data['world']
+        user.sent_state = user.far_sent_state = None
+    user.mark_moved()
+    if data['connected'] != was_connected:
+        user.connected = data['connected']
+    if data['connected'] and not was_connected:
+        await userlist.update(added=[user], publish=False)
+    elif was_connected and not data['connected']:
+        await userlist.update(removed=[user], publish=False)
+    elif data['connected'] and listed != (user._name, user.avatar, user.world):
+        await userlist.update(changed=[user], publish=False)
+
+
+def _on_moves(message: dict) -> None:
+    for auth_id, *state in message['data']:
+        replica = authorized_users.get(auth_id)
+        if replica is None or replica.node is None:
+            continue
+        replica.position[:] = state[0:3]
+        replica.orientation[:] = state[3:6]
+        replica.state, replica.gesture = state[6:8]
+        replica.mark_moved()
+
+
+def _apply_pos(user: User, data: dict) -> None:
+    user.position[:] = data['pos']['x'], data['pos']['y'], data['pos']['z']
+    user.orientation[:] = data['ori']['x'], data['ori']['y'], data['ori']['z']
+    user.state = data['state']
+    user.gesture = data['gesture']
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""Position ticker module"""
+
+from user.interest import UserGrid
+from user.model import authorized_users
+from utils.backplane import backplane
+from utils.orjson import Frame
+from utils.timer import scheduler
+from world.shard import shards
+
+
+class PositionTicker:
+    """Send the changed positions of each world once per tick, as one message per user
+
+    Entries only hold the fields that changed since they were last sent, users getting the full
+    position of everyone present when they connect or enter a world (User.send_present_pos).
+
+    With interest management, users only get the positions of users within the far radius,
+    and those beyond the near radius only every far_ticks ticks. As users come in and out of
+    reach of each other, changes are tracked against what each user was sent.
+
+    With several workers, only the owner of a world collects its entries, every worker then
+    sending them to its own users.
+    """
+    def __init__(self) -> None:
+        self._job = None
+        self._ticks = 0
+        self._owned = set()
+        self.near_radius = 0
+        self.far_radius = 0
+        self.far_ticks = 1
+
+    def start(self, interval: float, near_radius: float = 0, far_radius: float = 0,
+              far_ticks: int = 1) -> None:
+        """Start ticking, a far radius of 0 disabling interest management"""
+        self.near_radius = near_radius
+        self.far_radius = far_radius
+        self.far_ticks = max(1, far_ticks)
+        if self._job is None:
+            self._job = scheduler.schedule(interval, self.tick)
+
+    def stop(self) -> None:
+        """Stop ticking"""
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    async def tick(self) -> None:
+        """Send one batch to every user of every world where a position changed"""
+        self._ticks += 1
+        far_tick = self._ticks % self.far_ticks == 0
+        moved = []
+        owned = set()
+        for world in authorized_users.worlds():
+            users = authorized_users.present(world)
+            if backplane.active:
+                moved.extend(user for user in users if user.pos_dirty and user.node is None)
+                if not shards.owns(world):
+                    for user in users:
+                        user.pos_dirty = False
+                    continue
+                if world not in self._owned:
+                    # Taken over from another worker, whose baselines are unknown here
+                    for user in users:
+                        user.sent_state = user.far_sent_state = None
+                        user.mark_moved()
+            owned.add(world)
+            if not (entries := self._collect(users, far_tick)):
+                continue
+            if backplane.active:
+                await backplane.publish({'op': 'tick', 'world': world, 'far_tick': far_tick,
+                                         'data': [[user.auth_id, entry]
+                                                  for user, entry in entries.items()]})
+            await self._send(users, entries, far_tick)
+        self._owned = owned
+        # Owners send the moves of the users of this worker from their next tick
+        if moved:
+            moves = [[user.auth_id, *user.pos_state()] for user in moved]
+            await backplane.publish({'op': 'moves', 'data': moves})
+
+    async def deliver(self, world, data: list, far_tick: bool) -> None:
+        """Send the entries collected by the owner of a world to the users of this worker"""
+        entries = {}
+        for auth_id, entry in data:
+            if (user := authorized_users.get(auth_id)) is not None:
+                # Position states are lists once shared
+                entries[user] = tuple(entry) if self.far_radius else entry
+        if entries:
+            await self._send(authorized_users.present(world), entries, far_tick)
+
+    def _collect(self, users, far_tick: bool) -> dict:
+        if self.far_radius:
+            return self._collect_interest(users, far_tick)
+        return self._collect_world(users)
+
+    async def _send(self, users, entries: dict, far_tick: bool) -> None:
+        if self.far_radius:
+            await self._send_interest(users, entries, far_tick)
+        else:
+            await self._send_world(users, entries)
+
+    @staticmethod
+    def _collect_world(users) -> dict:
+        entries = {}
+        for user in users:
+            if user.pos_dirty:
+                state = user.pos_state()
+                if state != user.sent_state:
+                    entries[user] = user.pos_entry(user.sent_state)
+                    user.sent_state = state
+                user.pos_dirty = user.far_dirty = False
+        return entries
+
+    @staticmethod
+    async def _send_world(users, entries: dict) -> None:
+        # Users who didn't move share the same message
+        batch = Frame({'type': 'pos_batch', 'data': list(entries.values())})
+        for user in users:
+            if user.node is not None:
+                continue
+            if user not in entries:
+                await user.queue.put(batch)
+            elif len(entries) > 1:
+                await user.queue.put(Frame({
+                    'type': 'pos_batch',
+                    'data': [entry for other, entry in entries.items() if other is not user]
+                }))
+
+    @staticmethod
+    def _collect_interest(users, far_tick: bool) -> dict:
+        # Far ticks also catch up on moves skipped for users between the two radii
+        states = {}
+        for user in users:
+            if user.far_dirty if far_tick else user.pos_dirty:
+                states[user] = user.pos_state()
+                user.pos_dirty = False
+                if far_tick:
+                    user.far_dirty = False
+        return states
+
+    async def _send_interest(self, users, states: dict, far_tick: bool) -> None:
+        reach = (self.far_radius if far_tick else self.near_radius) ** 2
+        movers = UserGrid(self.far_radius, states)
+        everyone = None
+        for user in users:
+            if user.node is not None:
+                continue
+            if user in states:
+                # Having moved, the user may have come within reach of users who didn't
+                everyone = everyone or UserGrid(self.far_radius, users)
+                around = everyone.around(user)
+            else:
+                around = movers.around(user)
+            baselines = user.pos_baselines
+            # Far ticks of a moving user see everyone within reach, and forget the others
+            kept = {} if far_tick and user in states else None
+            data = []
+            for other, distance in around:
+                if other is user or distance > reach:
+                    continue
+                state = states[other] if other in states else other.pos_state()
+                if (since := baselines.get(other.auth_id)) != state:
+                    data.append(other.pos_entry(since, state))
+                    baselines[other.auth_id] = state
+                if kept is not None:
+                    kept[other.auth_id] = state
+            if kept is not None:
+                user.pos_baselines = kept
+            if data:
+                await user.queue.put(Frame({'type': 'pos_batch', 'data': data}))
+
+
+position_ticker = PositionTicker()
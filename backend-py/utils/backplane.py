@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""Backplane module, sharing messages between workers"""
+
+import asyncio
+import logging
+import struct
+import sys
+import uuid
+import orjson
+
+# Messages on the wire are orjson, after their length
+HEADER = struct.Struct('!I')
+
+
+class Backplane:
+    """Messages published to the other workers and handled from them
+
+    Without a transport, publishing does nothing, for a single worker to pay nothing.
+    """
+    def __init__(self) -> None:
+        self.node = uuid.uuid4().hex[:8]
+        self._handler = None
+        self._transport = None
+
+    @property
+    def active(self) -> bool:
+        return self._transport is not None
+
+    def subscribe(self, handler) -> None:
+        """Set the coroutine function handling messages from the other workers"""
+        self._handler = handler
+
+    async def start(self, transport) -> None:
+        """Start sharing messages through a transport"""
+        self._transport = transport
+        await transport.open(self)
+
+    async def stop(self) -> None:
+        """Stop sharing messages"""
+        if self._transport is not None:
+            await self._transport.close()
+            self._transport = None
+
+    async def publish(self, message: dict) -> None:
+        """Send a message to the other workers"""
+        if self._transport is not None:
+            await self._transport.send({**message, 'node': self.node})
+
+    async def dispatch(self, message: dict) -> None:
+        """Handle a message from the transport, ignoring those from this worker"""
+        if message.get('node') != self.node and self._handler is not None:
+            try:
+                await self._handler(message)
+            except Exception:
+                logging.exception('Backplane message %s failed', message.get('op'))
+
+    async def connected(self) -> None:
+        """Let the handler know the transport (re)connected, for it to share its state"""
+        await self.dispatch({'op': 'connected'})
+
+
+class LocalHub:
+    """Backplanes of a single process, what one publishes reaching all the others"""
+    def __init__(self) -> None:
+        self.backplanes = set()
+
+    async def send(self, message: dict) -> None:
+        for backplane in list(self.backplanes):
+            await backplane.dispatch(message)
+
+
+class LocalTransport:
+    """In-process transport, through a hub"""
+    def __init__(self, hub: LocalHub = None) -> None:
+        self.hub = hub or local_hub
+        self._backplane = None
+
+    async def open(self, backplane: Backplane) -> None:
+        self._backplane = backplane
+        self.hub.backplanes.add(backplane)
+        await backplane.connected()
+
+    async def close(self) -> None:
+        self.hub.backplanes.discard(self._backplane)
+
+    async def send(self, message: dict) -> None:
+        await self.hub.send(message)
+
+
+class SocketTransport:
+    """Transport through a broker, reconnecting whenever the connection drops
+
+    Messages published while disconnected are lost, the state being shared again on
+    reconnection.
+    """
+    def __init__(self, host: str, port: int, retry: float = 1.0) -> None:
+        self.host = host
+        self.port = port
+        self.retry = retry
+        self._backplane = None
+        self._writer = None
+        self._task = None
+
+    async def open(self, backplane: Backplane) -> None:
+        self._backplane = backplane
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def send(self, message: dict) -> None:
+        if self._writer is None:
+            return
+        data = orjson.dumps(message) # pylint: disable=maybe-no-member
+        self._writer.write(HEADER.pack(len(data)) + data)
+        await self._writer.drain()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(self.retry)
+                continue
+            self._writer = writer
+            try:
+                await self._backplane.connected()
+                while True:
+                    header = await reader.readexactly(HEADER.size)
+                    data = await reader.readexactly(HEADER.unpack(header)[0])
+                    await self._backplane.dispatch(orjson.loads(data)) # pylint: disable=maybe-no-member
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logging.warning('Backplane connection to %s:%s lost', self.host, self.port)
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(self.retry)
+
+
+class Broker:
+    """Relay of the messages from each worker to all the others, to be embedded in one of them
+    or run on its own"""
+    def __init__(self) -> None:
+        self._server = None
+        self._writers = set()
+
+    async def start(self, host: str, port: int) -> None:
+        """Listen for workers, raising OSError if the address is taken"""
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader, writer) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                data = await reader.readexactly(HEADER.unpack(header)[0])
+                for other in list(self._writers):
+                    if other is not writer:
+                        other.write(header + data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+local_hub = LocalHub()
+backplane = Backplane()
+broker = Broker()
+
+
+async def serve(host: str, port: int) -> None:
+    """Run a broker on its own"""
+    await broker.start(host, port)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1',
+                      int(sys.argv[2]) if len(sys.argv) > 2 else 7411))
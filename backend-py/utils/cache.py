@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""Cache backends module"""
+
+import os
+import pickle
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from flask_caching.backends.base import BaseCache
+import orjson
+from utils.orjson import OrJSONProvider
+
+# Hits, misses and evictions by key prefix (P-, T-, U-...)
+cache_counters = {}
+
+
+def count(key: str, event: str, amount: int = 1) -> None:
+    """Count a cache event for the prefix of a key"""
+    prefix = key[:2] if key[1:2] == '-' else 'other'
+    if (counter := cache_counters.get(prefix)) is None:
+        counter = cache_counters[prefix] = Counter()
+    counter[event] += amount
+
+
+def entry_size(key: str, value) -> int:
+    """Approximate the memory held by an entry, as its serialized size"""
+    if isinstance(value, (bytes, str)):
+        return len(key) + len(value)
+    try:
+        data = orjson.dumps(value, option=OrJSONProvider.option) # pylint: disable=maybe-no-member
+    except TypeError:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return len(key) + len(data)
+
+
+class MemoryCache(BaseCache):
+    """Cache in the memory of a worker, limited by the approximate size of its entries
+
+    Entries past the size limit are evicted least recently used first, and an entry bigger than
+    the whole limit isn't stored.
+    """
+    def __init__(self, max_bytes: int, default_timeout: int = 300) -> None:
+        super().__init__(default_timeout=default_timeout)
+        self.max_bytes = max_bytes
+        self.size = 0
+        # (expires, value, size) by key, least recently used first
+        self._entries = OrderedDict()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(config['CACHE_MAX_BYTES'], default_timeout=kwargs['default_timeout'])
+
+    def _expires(self, timeout) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout else 0
+
+    def _live(self, key):
+        if (entry := self._entries.get(key)) is None:
+            return None
+        if entry[0] and entry[0] <= time.time():
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, key):
+        if (entry := self._live(key)) is None:
+            count(key, 'misses')
+            return None
+        count(key, 'hits')
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def has(self, key) -> bool:
+        return self._live(key) is not None
+
+    def set(self, key, value, timeout=None) -> bool:
+        self._remove(key)
+        if (size := entry_size(key, value)) > self.max_bytes:
+            return False
+        self._entries[key] = (self._expires(timeout), value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            evicted, entry = self._entries.popitem(last=False)
+            self.size -= entry[2]
+            count(evicted, 'evictions')
+        return True
+
+    def add(self, key, value, timeout=None) -> bool:
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key) -> bool:
+        return self._remove(key)
+
+    def clear(self) -> bool:
+        self._entries.clear()
+        self.size = 0
+        return True
+
+    def _remove(self, key) -> bool:
+        if (entry := self._entries.pop(key, None)) is None:
+            return False
+        self.size -= entry[2]
+        return True
+
+
+class WorkerConnection:
+    """Connection to a SQLite file in WAL mode shared by the workers of a host, created with its
+    schema statements if needed"""
+    def __init__(self, path, busy_timeout: float, schema: tuple) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.schema = schema
+        self._db = None
+        self._pid = None
+
+    def get(self) -> sqlite3.Connection:
+        """Get the connection of this worker"""
+        # Connections don't survive a fork, each worker opens its own
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                db.execute(statement)
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+
+class SQLiteCache(BaseCache):
+    """Cache in a SQLite file, shared by all the workers of a host and kept across restarts
+
+    Entries past the size limit are evicted least recently used first, the limit being checked
+    every prune_every writes. Reads only record when an entry was used if it wasn't within the
+    last touch_every seconds, so they seldom need the write lock.
+
+    Calls run on the event loop: a database locked by another worker for longer than the busy
+    timeout turns reads into misses and drops writes, rather than holding up the worker.
+    """
+    def __init__(self, path: str, max_bytes: int, default_timeout: int = 300,
+                 prune_every: int = 64, busy_timeout: float = 0.05,
+                 touch_every: float = 60) -> None:
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self.busy_timeout = busy_timeout
+        self.touch_every = touch_every
+        self._writes = 0
+        self._db = WorkerConnection(path, busy_timeout, (
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, '
+            'size INTEGER, expires REAL, used REAL)',
+            'CREATE INDEX IF NOT EXISTS cache_used ON cache (used)'))
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(config['CACHE_SQLITE_PATH'], config['CACHE_MAX_BYTES'],
+                   default_timeout=kwargs['default_timeout'],
+                   busy_timeout=config['CACHE_SQLITE_TIMEOUT'])
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _expires(self, timeout) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout else 0
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        now = time.time()
+        found = {}
+        touched = []
+        try:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                for key, value, used in self.db.execute(
+                    'SELECT key, value, used FROM cache '
+                    f"WHERE key IN ({','.join('?' * len(chunk))}) "
+                    'AND (expires = 0 OR expires > ?)', (*chunk, now)
+                ):
+                    found[key] = value
+                    if used < now - self.touch_every:
+                        touched.append((now, key))
+        except sqlite3.OperationalError:
+            # Locked for too long, what wasn't read yet is a miss
+            self._busy(keys)
+        for key in keys:
+            count(key, 'hits' if key in found else 'misses')
+        if touched:
+            try:
+                with self.db:
+                    self.db.executemany('UPDATE cache SET used = ? WHERE key = ?', touched)
+            except sqlite3.OperationalError:
+                self._busy(key for _, key in touched)
+        return [pickle.loads(found[key]) if key in found else None for key in keys]
+
+    def has(self, key) -> bool:
+        try:
+            return self.db.execute(
+                'SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+                (key, time.time())
+            ).fetchone() is not None
+        except sqlite3.OperationalError:
+            self._busy((key,))
+            return False
+
+    def set(self, key, value, timeout=None) -> bool:
+        return self.set_many({key: value}, timeout) == [key]
+
+    def set_many(self, mapping, timeout=None):
+        expires = self._expires(timeout)
+        now = time.time()
+        rows = []
+        for key, value in mapping.items():
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((key, data, len(key) + len(data), expires, now))
+        try:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)', rows)
+        except sqlite3.OperationalError:
+            self._busy(mapping)
+            return []
+        self._writes += len(rows)
+        if self._writes >= self.prune_every:
+            self._writes = 0
+            self._prune()
+        return list(mapping)
+
+    def add(self, key, value, timeout=None) -> bool:
+        now = time.time()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        try:
+            with self.db:
+                self.db.execute('DELETE FROM cache WHERE key = ? AND expires != 0 AND expires <= ?',
+                                (key, now))
+                cursor = self.db.execute('INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)',
+                                         (key, data, len(key) + len(data), self._expires(timeout),
+                                          now))
+        except sqlite3.OperationalError:
+            self._busy((key,))
+            return False
+        return cursor.rowcount == 1
+
+    def delete(self, key) -> bool:
+        try:
+            with self.db:
+                return self.db.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+        except sqlite3.OperationalError:
+            self._busy((key,))
+            return False
+
+    def delete_many(self, *keys):
+        return [key for key in keys if self.delete(key)]
+
+    def clear(self) -> bool:
+        try:
+            with self.db:
+                self.db.execute('DELETE FROM cache')
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    @staticmethod
+    def _busy(keys) -> None:
+        for key in keys:
+            count(key, 'busy')
+
+    def _prune(self) -> None:
+        try:
+            with self.db:
+                self._evict()
+        except sqlite3.OperationalError:
+            # Done by the next writes instead
+            self._writes = self.prune_every
+
+    def _evict(self) -> None:
+        self.db.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (time.time(),))
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently used until back under the limit
+        evicted = []
+        for key, size in self.db.execute('SELECT key, size FROM cache ORDER BY used'):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.db.executemany('DELETE FROM cache WHERE key = ?', evicted)
+        for key, in evicted:
+            count(key, 'evictions')
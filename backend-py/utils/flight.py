@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+"""Single flight module"""
+
+import asyncio
+
+
+class SingleFlight:
+    """Concurrent calls for the same key sharing the call made by the first of them"""
+    def __init__(self) -> None:
+        self._calls = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key, func):
+        """Await func(), or the call already running for the key
+
+        The call is shielded, a caller going away not cancelling it for the others.
+        """
+        if (call := self._calls.get(key)) is None:
+            call = self._calls[key] = asyncio.ensure_future(func())
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(call)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""HTTP client module"""
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+import httpx
+
+
+class Stream:
+    """Response read from an upstream as it arrives, holding its host slot until closed"""
+    def __init__(self, response: httpx.Response, release) -> None:
+        self.response = response
+        self._release = release
+
+    async def iter_raw(self, chunk_size: int):
+        """Relay the body as sent by the upstream, closing the stream at its end"""
+        try:
+            async for chunk in self.response.aiter_raw(chunk_size):
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the response and release its host slot"""
+        if self._release is not None:
+            release, self._release = self._release, None
+            await self.response.aclose()
+            release()
+
+
+class HttpClient:
+    """HTTP client shared by the whole app, keeping connections to upstreams open
+
+    Requests to one host are limited, for a world loading hundreds of assets from the same
+    upstream not to hog the pool.
+    """
+    def __init__(self) -> None:
+        self._client = None
+        # Semaphores go away with the last request to their host
+        self._hosts = weakref.WeakValueDictionary()
+        self.per_host = 0
+
+    def start(self, max_connections: int, per_host: int, http2: bool, timeout: float) -> None:
+        """Open the connection pool"""
+        self.per_host = per_host
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_connections),
+                timeout=timeout,
+                follow_redirects=True
+            )
+
+    async def close(self) -> None:
+        """Close the connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        """Hold one of the request slots of the host of an URL, yielding the client"""
+        async with self._semaphore(url):
+            yield self._client
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        if (semaphore := self._hosts.get(host)) is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    async def stream(self, url: str, **kwargs) -> Stream:
+        """Get an URL, returning as soon as the headers of the response arrive"""
+        semaphore = self._semaphore(url)
+        await semaphore.acquire()
+        try:
+            request = self._client.build_request('GET', url, **kwargs)
+            response = await self._client.send(request, stream=True)
+        except BaseException:
+            semaphore.release()
+            raise
+        return Stream(response, semaphore.release)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        """Get an URL, reading the whole response"""
+        async with self.limit(url) as client:
+            return await client.get(url, **kwargs)
+
+
+http_client = HttpClient()
@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 """orjson module"""
 
+from collections import Counter
 import orjson
 from quart.json.provider import JSONProvider
 
+# Messages encoded for websockets, by type
+encode_counters = Counter()
+
 
 class OrJSONProvider(JSONProvider):
     """OrJSONProvider class for a faster JSONProvider"""
-    option = orjson.OPT_NON_STR_KEYS # pylint: disable=maybe-no-member
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY # pylint: disable=maybe-no-member
 
     def dumps(self, obj, **kwargs):
         """Dumps JSON"""
@@ -16,3 +20,16 @@ class OrJSONProvider(JSONProvider):
     def loads(self, s, **kwargs):
         """Loads JSON"""
         return orjson.loads(s) # pylint: disable=maybe-no-member
+
+
+class Frame:
+    """Websocket message encoded once, to be sent as is to all its recipients"""
+    __slots__ = ('type', 'user', 'message', 'data')
+
+    def __init__(self, message: dict) -> None:
+        self.type = message['type']
+        self.user = message.get('user')
+        self.message = message
+        data = orjson.dumps(message, option=OrJSONProvider.option) # pylint: disable=maybe-no-member
+        self.data = data.decode()
+        encode_counters[self.type] += 1
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Send queue module"""
+
+import asyncio
+import time
+from collections import Counter, deque
+from utils.orjson import Frame
+
+# How queued frames are handled, by message type, anything else being dropped when full
+KEEP = 'keep'                    # Never dropped
+COALESCE = 'coalesce'            # Replaces the queued frame of the same type
+COALESCE_USER = 'coalesce_user'  # Replaces the queued frame of the same type and user
+MERGE = 'merge'                  # Merged into the queued frame of the same type
+POLICIES = {
+    'msg': KEEP,
+    'list': COALESCE,
+    'pos': COALESCE_USER,
+    'avatar': COALESCE_USER,
+    'pos_batch': MERGE
+}
+
+dropped_counters = Counter()
+coalesced_counters = Counter()
+stalled_counter = Counter()
+
+
+def merge_pos_batches(older: dict, newer: dict) -> dict:
+    """Merge two pos_batch messages, the newer fields winning"""
+    entries = {entry['user']: entry for entry in older['data']}
+    for entry in newer['data']:
+        if (previous := entries.get(entry['user'])) is None:
+            entries[entry['user']] = entry
+            continue
+        merged = {**previous, **entry}
+        for group in ('pos', 'ori'):
+            if group in previous and group in entry:
+                merged[group] = {**previous[group], **entry[group]}
+        entries[entry['user']] = merged
+    return {'type': 'pos_batch', 'data': list(entries.values())}
+
+
+class SendQueue:
+    """Bounded queue of frames for a user, coalescing what can be
+
+    A consumer that keeps the queue full for longer than the stall timeout is flagged as
+    stalled, for its connection to be dropped.
+    """
+    def __init__(self, maxsize: int, stall_timeout: float) -> None:
+        self.maxsize = maxsize
+        self.stall_timeout = stall_timeout
+        # Slots are one-item lists, so coalesced frames can be replaced in place
+        self._slots = deque()
+        self._keyed = {}
+        self._ready = asyncio.Event()
+        self._stalled = asyncio.Event()
+        self._full_since = None
+
+    def qsize(self) -> int:
+        return len(self._slots)
+
+    async def put(self, frame: Frame) -> None:
+        """Queue a frame, or merge it with a queued one"""
+        policy = POLICIES.get(frame.type)
+        key = None
+        if policy in (COALESCE, MERGE):
+            key = (frame.type,)
+        elif policy == COALESCE_USER:
+            key = (frame.type, frame.user)
+
+        if key is not None and (slot := self._keyed.get(key)) is not None:
+            if policy == MERGE:
+                slot[0] = Frame(merge_pos_batches(slot[0].message, frame.message))
+            else:
+                slot[0] = frame
+            coalesced_counters[frame.type] += 1
+            return
+
+        if len(self._slots) >= self.maxsize:
+            self._check_stall()
+            if policy != KEEP:
+                dropped_counters[frame.type] += 1
+                return
+
+        slot = [frame]
+        self._slots.append(slot)
+        if key is not None:
+            self._keyed[key] = slot
+        self._ready.set()
+
+    async def get(self) -> Frame:
+        """Wait for the next frame"""
+        while not self._slots:
+            self._ready.clear()
+            await self._ready.wait()
+        slot = self._slots.popleft()
+        frame = slot[0]
+        for key in ((frame.type,), (frame.type, frame.user)):
+            if self._keyed.get(key) is slot:
+                del self._keyed[key]
+        if len(self._slots) < self.maxsize:
+            self._full_since = None
+        return frame
+
+    def _check_stall(self) -> None:
+        now = time.monotonic()
+        if self._full_since is None:
+            self._full_since = now
+        elif now - self._full_since > self.stall_timeout and not self._stalled.is_set():
+            stalled_counter['stalled'] += 1
+            self._stalled.set()
+
+    async def wait_stalled(self) -> None:
+        """Wait for the consumer to be flagged as stalled"""
+        await self._stalled.wait()
+
+    def resume(self) -> None:
+        """Start over after a reconnection, dropping what was queued"""
+        self._slots.clear()
+        self._keyed.clear()
+        self._full_since = None
+        self._stalled.clear()
@@ -3,25 +3,97 @@
 
 import asyncio
 import contextlib
+import heapq
+import itertools
+import logging
 from typing import Callable
 
-class Timer:
-    """Timer class"""
-    def __init__(self, timeout: int, callback: Callable) -> None:
-        self._timeout = timeout
-        self._callback = callback
+class Job:
+    """Periodic job of a Scheduler"""
+    def __init__(self, interval: float, callback: Callable, due: float) -> None:
+        self.interval = interval
+        self.callback = callback
+        self.due = due
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Stop running the job"""
+        self.cancelled = True
+
+
+class Scheduler:
+    """Run periodic coroutine jobs from a single task, without creating a task per run"""
+    def __init__(self) -> None:
+        self._heap = []
+        self._order = itertools.count()
         self._task = None
+        self._waiter = None
 
-    async def start(self) -> None:
-        """Start timer"""
-        await asyncio.sleep(self._timeout)
-        self._task = asyncio.ensure_future(self._callback())
+    def __len__(self) -> int:
+        return sum(1 for _, _, job in self._heap if not job.cancelled)
 
-    async def cancel(self) -> None:
-        """Stop timer"""
-        if not self._task:
-            return
-        if self._task.cancelled():
+    def schedule(self, interval: float, callback: Callable) -> Job:
+        """Run callback every interval seconds, starting one interval from now"""
+        loop = asyncio.get_running_loop()
+        job = Job(interval, callback, loop.time() + interval)
+        self._push(job)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        elif self._heap[0][2] is job:
+            # Earlier than what the loop is waiting for
+            self._wake()
+        return job
+
+    async def stop(self) -> None:
+        """Cancel all jobs and stop the loop"""
+        for _, _, job in self._heap:
+            job.cancel()
+        self._heap.clear()
+        if self._task is not None:
             self._task.cancel()
             with contextlib.suppress(asyncio.CancelledError):
                 await self._task
+            self._task = None
+
+    def _push(self, job: Job) -> None:
+        heapq.heappush(self._heap, (job.due, next(self._order), job))
+
+    def _wake(self, *_) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _sleep(self, delay: float = None) -> None:
+        """Sleep until the delay or a wake up, whichever comes first"""
+        loop = asyncio.get_running_loop()
+        self._waiter = loop.create_future()
+        handle = loop.call_later(delay, self._wake) if delay is not None else None
+        try:
+            await self._waiter
+        finally:
+            if handle is not None:
+                handle.cancel()
+            self._waiter = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                await self._sleep()
+                continue
+            if (delay := self._heap[0][0] - loop.time()) > 0:
+                await self._sleep(delay)
+                continue
+            _, _, job = heapq.heappop(self._heap)
+            try:
+                await job.callback()
+            except Exception: # pylint: disable=broad-exception-caught
+                logging.exception('Scheduled job failed')
+            if not job.cancelled:
+                # Keep the pace, but don't try to catch up on missed runs
+                job.due = max(job.due + job.interval, loop.time())
+                self._push(job)
+
+
+scheduler = Scheduler()
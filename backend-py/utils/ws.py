@@ -1,18 +1,23 @@
 #!/usr/bin/env python
 """Websocket module"""
 
-from quart import websocket
-from user.model import broadcast, broadcast_userlist, User
+from collections import Counter
+from quart import current_app, websocket
+from user.model import broadcast, userlist, User
+
+# Frames sent to websockets, by message type
+send_counters = Counter()
 
 
 async def sending(user: User):
-    await broadcast_userlist()
+    await userlist.connect(user)
     await broadcast({'type': 'join', 'data': user.auth_id})
     try:
         while True:
-            data = await user.queue.get()
+            frame = await user.queue.get()
             for socket in user.websockets:
-                await socket.send_json(data)
+                await socket.send(frame.data)
+                send_counters[frame.type] += 1
     finally:
         user.websockets.remove(websocket._get_current_object())
         if not user.websockets:
@@ -20,7 +25,7 @@ async def sending(user: User):
             # Force Timer cancel
             await user.set_timer()
             await broadcast({'type': 'part', 'data': user.auth_id})
-            await broadcast_userlist()
+            await userlist.disconnect(user)
 
 
 async def receiving(user: User):
@@ -33,14 +38,21 @@ async def process_msg(user: User, payload: dict) -> None:
     if payload['type'] == 'msg':
         await broadcast({'type': 'msg', 'user': user.auth_id, 'data': payload['data']})
     elif payload['type'] == 'pos':
-        user.position[0] = payload['data']['pos']['x']
-        user.position[1] = payload['data']['pos']['y']
-        user.position[2] = payload['data']['pos']['z']
-        user.orientation[0] = payload['data']['ori']['x']
-        user.orientation[1] = payload['data']['ori']['y']
-        user.orientation[2] = payload['data']['ori']['z']
+        decimals = current_app.config['POSITION_DECIMALS']
+        ori_decimals = current_app.config['ORIENTATION_DECIMALS']
+        state = user.pos_state()
+        user.position[0] = round(payload['data']['pos']['x'], decimals)
+        user.position[1] = round(payload['data']['pos']['y'], decimals)
+        user.position[2] = round(payload['data']['pos']['z'], decimals)
+        user.orientation[0] = round(payload['data']['ori']['x'], ori_decimals)
+        user.orientation[1] = round(payload['data']['ori']['y'], ori_decimals)
+        user.orientation[2] = round(payload['data']['ori']['z'], ori_decimals)
         user.state = payload['data']['state']
         user.gesture = payload['data']['gesture']
+        if user.pos_state() != state:
+            user.mark_moved()
+    elif payload['type'] == 'list':
+        await userlist.send(user)
     elif payload['type'] == 'avatar':
         user.avatar = payload['data']
         await broadcast({'type': 'avatar', 'user': user.auth_id, 'data': user.avatar})
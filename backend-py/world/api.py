@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 """World API routes"""
 
-from quart import request, Blueprint, current_app
+import gzip
+import orjson
+from quart import request, Blueprint, current_app, Response, stream_with_context
 from quart_jwt_extended import get_jwt_identity, jwt_required
 from user.model import authorized_users
+from world.columns import PROPS_MIMETYPE, encode_props
 from world.model import World
+from world.terrain import PAGE_MIMETYPE, raw_page, to_sparse, unpack_page
 
 api_world = Blueprint('api_world', __name__, url_prefix='/api/v1/world')
 
@@ -21,9 +25,7 @@ async def world_list():
 @api_world.get('/<int:world_id>')
 async def world_get(world_id):
     """World fetching"""
-    if curr_user := next(
-        (user for user in authorized_users if user.auth_id == get_jwt_identity()),
-    None):
+    if curr_user := authorized_users.get(get_jwt_identity()):
         world = await World(world_id).to_dict()
         if world['name'] is None:
             return world, 404
@@ -52,15 +54,93 @@ async def world_props_get(world_id):
     min_z = int(min_z) if min_z and min_z.lstrip('-').isdigit() else None
     max_z = int(max_z) if max_z and max_z.lstrip('-').isdigit() else None
 
-    # Ignore Y for cache keys
-    cache_key = f"P-{world_id}-{min_x}-{max_x}-{min_z}-{max_z}"
-    if (props := cache.get(cache_key)) is not None:
-        return props, 200
-
-    props = await World(world_id).props(min_x, max_x, min_y, max_y, min_z, max_z)
-    cache.set(cache_key, props)
-
-    return props, 200
+    columns = (request.args.get("format") == 'columns' or
+               request.accept_mimetypes.best_match(['application/json', PROPS_MIMETYPE]) ==
+               PROPS_MIMETYPE)
+
+    if not columns and all(bound is None for bound in (min_x, max_x, min_y, max_y, min_z, max_z)):
+        # Whole world: write entries out as they are read instead of building it all at once
+        # Bound to this request, which only exists once the route runs
+        stream = stream_with_context(_stream_props)
+        return Response(stream(world_id, current_app.config['PROPS_STREAM_CHUNK']),
+                        content_type='application/json', headers={'Vary': 'Accept'}, status=200)
+
+    if None in (min_x, max_x, min_z, max_z):
+        # Ignore Y for cache keys, it is filtered afterwards
+        cache_key = f"P-{world_id}-{min_x}-{max_x}-{min_z}-{max_z}"
+        if (props := cache.get(cache_key)) is None:
+            props = await World(world_id).props(min_x, max_x, None, None, min_z, max_z)
+            cache.set(cache_key, props)
+    else:
+        props = await _tiled_props(world_id, min_x, max_x, min_z, max_z)
+
+    props = _trim_props(props, min_x, max_x, min_y, max_y, min_z, max_z)
+
+    if columns:
+        return Response(encode_props(props['entries']), content_type=PROPS_MIMETYPE,
+                        headers={'Vary': 'Accept'}, status=200)
+
+    return props, 200, {'Vary': 'Accept'}
+
+
+async def _stream_props(world_id, chunk_size):
+    """Props JSON of a whole world, produced chunk by chunk"""
+    yield b'{"entries":['
+    separator = b''
+    async for entries in World(world_id).iter_props(chunk_size):
+        if entries:
+            # Drop the brackets of each chunk to make them a single array
+            yield separator + orjson.dumps(entries)[1:-1] # pylint: disable=maybe-no-member
+            separator = b','
+    yield b']}'
+
+
+async def _tiled_props(world_id, min_x, max_x, min_z, max_z):
+    """Get props from cached tiles, fetching the missing ones in a single query"""
+    cache = current_app.cache
+    size = current_app.config['PROPS_CACHE_TILE']
+    if min_x >= max_x or min_z >= max_z:
+        return {'entries': []}
+
+    # Upper bounds are exclusive
+    tiles = [(tile_x, tile_z)
+             for tile_x in range(min_x // size, (max_x - 1) // size + 1)
+             for tile_z in range(min_z // size, (max_z - 1) // size + 1)]
+    if len(tiles) > current_app.config['PROPS_CACHE_MAX_TILES']:
+        # Too wide to be worth caching
+        return await World(world_id).props(min_x, max_x, None, None, min_z, max_z)
+
+    keys = [f"P-{world_id}-{tile_x}-{tile_z}" for tile_x, tile_z in tiles]
+    cached = dict(zip(tiles, cache.get_many(*keys)))
+
+    if missing := [tile for tile, entries in cached.items() if entries is None]:
+        tile_xs = [tile_x for tile_x, _ in missing]
+        tile_zs = [tile_z for _, tile_z in missing]
+        props = await World(world_id).props(min(tile_xs) * size, (max(tile_xs) + 1) * size,
+                                            None, None,
+                                            min(tile_zs) * size, (max(tile_zs) + 1) * size)
+        # The box may hold tiles that were already cached, their props must not be added twice
+        fetched = {tile: [] for tile in missing}
+        for prop in props['entries']:
+            if (entries := fetched.get((prop[3] // size, prop[5] // size))) is not None:
+                entries.append(prop)
+        cached.update(fetched)
+        cache.set_many({key: fetched[tile] for key, tile in zip(keys, tiles) if tile in fetched})
+
+    return {'entries': [prop for entries in cached.values() for prop in entries]}
+
+
+def _trim_props(props, min_x, max_x, min_y, max_y, min_z, max_z):
+    """Filter out props outside the bounds, a 'None' value meaning no bound"""
+    bounds = [(axis, low, high)
+              for axis, low, high in ((3, min_x, max_x), (4, min_y, max_y), (5, min_z, max_z))
+              if low is not None or high is not None]
+    if not bounds:
+        return props
+    return {'entries': [prop for prop in props['entries']
+                        if all((low is None or prop[axis] >= low) and
+                               (high is None or prop[axis] < high)
+                               for axis, low, high in bounds)]}
 
 
 @api_world.get('/<int:world_id>/terrain')
@@ -74,9 +154,32 @@ async def get_terrain_page(world_id):
     page_z = int(page_z) if page_z and page_z.lstrip('-').isdigit() else 0
 
     cache_key = f"T-{world_id}-{page_x}-{page_z}"
-    if (page := cache.get(cache_key)) is not None:
-        return page, 200
-
-    page = await World(world_id).get_terrain_page(page_x, page_z)
-
-    return page, 200
+    if (page := cache.get(cache_key)) is None:
+        page = await World(world_id).get_terrain_data(page_x, page_z)
+        cache.set(cache_key, page)
+
+    if request.accept_mimetypes.best_match(['application/json', PAGE_MIMETYPE]) == PAGE_MIMETYPE:
+        return _binary_terrain_page(page)
+
+    textures, heights = unpack_page(page)
+
+    if request.args.get("format") == 'array':
+        # Compact form: one texture and one height per cell, row by row
+        return {'textures': textures, 'heights': heights}, 200, {'Vary': 'Accept'}
+
+    return to_sparse(textures, heights), 200, {'Vary': 'Accept'}
+
+
+def _binary_terrain_page(page):
+    """Raw terrain page response, compressed when the client allows it"""
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if request.accept_encodings['deflate']:
+        # Packed pages are already zlib streams, which is what HTTP deflate is
+        headers['Content-Encoding'] = 'deflate'
+        body = page
+    elif request.accept_encodings['gzip']:
+        headers['Content-Encoding'] = 'gzip'
+        body = gzip.compress(raw_page(page), compresslevel=6)
+    else:
+        body = raw_page(page)
+    return Response(body, content_type=PAGE_MIMETYPE, headers=headers, status=200)
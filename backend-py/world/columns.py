@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Column-oriented props encoding module
+
+Layout, all integers being little-endian:
+    magic b'LPC1', uint32 prop count, uint32 string count
+    uint32 byte length of every string, then the UTF-8 strings back to back
+    int32 columns of prop count values each, in order: id, date, x, y, z, pi, ya, ro, name, desc,
+    act. Props are sorted by id, and id, x, y, z are delta-encoded (first value from 0).
+    name, desc and act are indexes in the strings, -1 standing for null.
+"""
+
+import struct
+from operator import itemgetter
+import numpy as np
+
+PROPS_MIMETYPE = 'application/vnd.lemuria.props'
+MAGIC = b'LPC1'
+
+ID, DATE, NAME, X, Y, Z, PI, YA, RO, DESC, ACT = range(11)
+INT_COLUMNS = (ID, DATE, X, Y, Z, PI, YA, RO)
+STRING_COLUMNS = (NAME, DESC, ACT)
+DELTA_COLUMNS = (ID, X, Y, Z)
+
+
+def encode_props(entries: list) -> bytes:
+    """Encode prop entries into columns, reading the entry lists in place"""
+    count = len(entries)
+    strings = {None: -1}
+    columns = np.empty((len(INT_COLUMNS) + len(STRING_COLUMNS), count), dtype='<i4')
+    for col, index in enumerate(INT_COLUMNS):
+        columns[col] = np.fromiter(map(itemgetter(index), entries), dtype='<i4', count=count)
+    for col, index in enumerate(STRING_COLUMNS, len(INT_COLUMNS)):
+        values = list(map(itemgetter(index), entries))
+        for value in dict.fromkeys(values):
+            strings.setdefault(value, len(strings) - 1)
+        columns[col] = np.fromiter(map(strings.__getitem__, values), dtype='<i4', count=count)
+
+    columns = columns[:, np.argsort(columns[0], kind='stable')]
+    for col, index in enumerate(INT_COLUMNS):
+        if index in DELTA_COLUMNS:
+            columns[col] = np.diff(columns[col], prepend=0)
+
+    encoded = [s.encode() for s in strings if s is not None]
+    return b''.join((
+        MAGIC,
+        struct.pack('<II', len(entries), len(encoded)),
+        np.array([len(s) for s in encoded], dtype='<u4').tobytes(),
+        *encoded,
+        columns.tobytes()
+    ))
+
+
+def decode_props(data: bytes) -> list:
+    """Decode columns back into prop entries"""
+    if data[:4] != MAGIC:
+        raise ValueError('Not a props column payload')
+    count, string_count = struct.unpack_from('<II', data, 4)
+    offset = 12
+    lengths = np.frombuffer(data, dtype='<u4', count=string_count, offset=offset)
+    offset += 4 * string_count
+    strings = []
+    for length in lengths.tolist():
+        strings.append(data[offset:offset + length].decode())
+        offset += length
+    columns = np.frombuffer(data, dtype='<i4', offset=offset).reshape(
+        len(INT_COLUMNS) + len(STRING_COLUMNS), count).copy()
+    for col, index in enumerate(INT_COLUMNS):
+        if index in DELTA_COLUMNS:
+            columns[col] = np.cumsum(columns[col])
+
+    entries = [[None] * 11 for _ in range(count)]
+    for col, index in enumerate(INT_COLUMNS):
+        for entry, value in zip(entries, columns[col].tolist()):
+            entry[index] = value
+    for col, index in enumerate(STRING_COLUMNS, len(INT_COLUMNS)):
+        for entry, value in zip(entries, columns[col].tolist()):
+            entry[index] = strings[value] if value >= 0 else None
+    return entries
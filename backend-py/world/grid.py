@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Spatial grid module"""
+
+# Positions of the coordinates in a prop entry
+# [id, date, name, x, y, z, pi, ya, ro, desc, act]
+X, Y, Z = 3, 4, 5
+
+
+class PropGrid:
+    """Fixed-size cells of prop entries keyed by (x // cell, z // cell)"""
+    def __init__(self, cell_size: int) -> None:
+        self.cell_size = cell_size
+        self._cells = {}
+        self._locations = {}
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def _cell(self, x: int, z: int) -> tuple:
+        return (x // self.cell_size, z // self.cell_size)
+
+    def add(self, entry: list) -> None:
+        """Add or replace a prop entry"""
+        self.remove(entry[0])
+        cell = self._cell(entry[X], entry[Z])
+        self._cells.setdefault(cell, {})[entry[0]] = entry
+        self._locations[entry[0]] = cell
+
+    def remove(self, prop_id: int) -> None:
+        """Remove a prop entry if it is indexed"""
+        if (cell := self._locations.pop(prop_id, None)) is None:
+            return
+        entries = self._cells[cell]
+        del entries[prop_id]
+        if not entries:
+            del self._cells[cell]
+
+    def chunks(self, size: int):
+        """Yield all the entries, at most size at a time, without gathering them all"""
+        chunk = []
+        for entries in list(self._cells.values()):
+            for entry in entries.values():
+                chunk.append(entry)
+                if len(chunk) == size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def _overlapping(self, min_x, max_x, min_z, max_z):
+        """Yield (entries, inside) for every cell touching the box, inside meaning the
+        cell is fully covered on X and Z"""
+        if None in (min_x, max_x, min_z, max_z):
+            # Unbounded on one axis: walk the existing cells only
+            for entries in self._cells.values():
+                yield entries, False
+            return
+        # Upper bounds are exclusive
+        size = self.cell_size
+        min_cx, min_cz = self._cell(min_x, min_z)
+        max_cx, max_cz = self._cell(max_x - 1, max_z - 1)
+        if (max_cx - min_cx + 1) * (max_cz - min_cz + 1) > len(self._cells):
+            cells = [(cell, entries) for cell, entries in self._cells.items()
+                     if min_cx <= cell[0] <= max_cx and min_cz <= cell[1] <= max_cz]
+        else:
+            cells = [((cx, cz), entries)
+                     for cx in range(min_cx, max_cx + 1)
+                     for cz in range(min_cz, max_cz + 1)
+                     if (entries := self._cells.get((cx, cz))) is not None]
+        for (cx, cz), entries in cells:
+            yield entries, (cx * size >= min_x and (cx + 1) * size <= max_x and
+                            cz * size >= min_z and (cz + 1) * size <= max_z)
+
+    def query(self, min_x = None, max_x = None, min_y = None, max_y = None,
+              min_z = None, max_z = None) -> list:
+        """Get entries within the box, a 'None' bound meaning no bound on that side"""
+        xz_bounds = [(axis, low, high)
+                     for axis, low, high in ((X, min_x, max_x), (Z, min_z, max_z))
+                     if low is not None or high is not None]
+        y_bounds = [(Y, min_y, max_y)] if min_y is not None or max_y is not None else []
+        out = []
+        for entries, inside in self._overlapping(min_x, max_x, min_z, max_z):
+            bounds = y_bounds if inside else xz_bounds + y_bounds
+            if not bounds:
+                out.extend(entries.values())
+                continue
+            out.extend(entry for entry in entries.values()
+                       if all((low is None or entry[axis] >= low) and
+                              (high is None or entry[axis] < high)
+                              for axis, low, high in bounds))
+        return out
@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 """World module"""
 
-from quart import json
+import asyncio
+import time
+from quart import current_app, json
 from db import db, db_required
 from user.model import authorized_users
+from world.grid import PropGrid
+from world.terrain import decode_page, pack_page
+
+# Spatial indexes of props by world id, as (grid, props signature, last checked)
+prop_grids = {}
+_prop_grid_locks = {}
 
 class World:
     """World class"""
@@ -87,12 +95,53 @@ class World:
             'water': self._water
         }
 
+    @staticmethod
+    def _prop_entry(prop):
+        return [
+            prop.id, prop.date, prop.name, prop.x, prop.y, prop.z, prop.pi, prop.ya, prop.ro,
+            prop.desc, prop.act
+        ]
+
+    async def _prop_signature(self):
+        """Summary of the world props changing with any import, telling a stale index"""
+        row = (await db.query_raw(
+            'SELECT COUNT(*) AS count, MAX(id) AS last_id, MAX(date) AS last_date '
+            'FROM prop WHERE wid = ?', self.world_id
+        ))[0]
+        return (row['count'], row['last_id'], row['last_date'])
+
+    @db_required
+    async def _prop_grid(self):
+        """Get the spatial index of the world props, loading it on first access and again
+        when the props changed in the database, checked every PROP_INDEX_CHECK seconds"""
+        check = current_app.config['PROP_INDEX_CHECK']
+        if (cached := prop_grids.get(self.world_id)) is not None \
+                and time.monotonic() - cached[2] < check:
+            return cached[0]
+        async with _prop_grid_locks.setdefault(self.world_id, asyncio.Lock()):
+            if (cached := prop_grids.get(self.world_id)) is not None \
+                    and time.monotonic() - cached[2] < check:
+                return cached[0]
+            signature = await self._prop_signature()
+            if cached is not None and cached[1] == signature:
+                grid = cached[0]
+            else:
+                grid = PropGrid(current_app.config['PROP_INDEX_CELL'])
+                for prop in await db.prop.find_many(where={'wid': self.world_id}):
+                    grid.add(self._prop_entry(prop))
+            prop_grids[self.world_id] = (grid, signature, time.monotonic())
+        return grid
+
     @db_required
     async def props(self, min_x = None, max_x = None, min_y = None, max_y = None,
                     min_z = None, max_z = None):
         # Having a 'None' value on one of those coordinate criterias means no bound will be
         # applied when querying all objects
 
+        if current_app.config['PROP_INDEX_CELL']:
+            grid = await self._prop_grid()
+            return {'entries': grid.query(min_x, max_x, min_y, max_y, min_z, max_z)}
+
         # Build the WHERE clause
         where_clauses = [
             {'x': {'gte': min_x}} if min_x is not None else None,
@@ -104,10 +153,7 @@ class World:
         ]
 
         props = [
-            [
-                prop.id, prop.date, prop.name, prop.x, prop.y, prop.z, prop.pi, prop.ya, prop.ro,
-                prop.desc, prop.act
-            ]
+            self._prop_entry(prop)
             for prop in await db.prop.find_many(
                 where={
                     'AND': [
@@ -126,6 +172,24 @@ class World:
 
         return {'entries': props}
 
+    async def iter_props(self, chunk_size):
+        """Yield all the props of the world, chunk by chunk"""
+        if current_app.config['PROP_INDEX_CELL']:
+            for entries in (await self._prop_grid()).chunks(chunk_size):
+                yield entries
+            return
+
+        if not db.is_connected():
+            await db.connect()
+        last_id = 0
+        while props := await db.prop.find_many(
+                where={'wid': self.world_id, 'id': {'gt': last_id}},
+                order={'id': 'asc'},
+                take=chunk_size
+            ):
+            yield [self._prop_entry(prop) for prop in props]
+            last_id = props[-1].id
+
     @classmethod
     @db_required
     async def get_list(cls):
@@ -133,28 +197,23 @@ class World:
             {
                 'id': world.id,
                 'name': world.name,
-                'users': len([u for u in authorized_users if u.connected and u.world == world.id])
+                'users': authorized_users.present_count(world.id)
             }
             for world in await db.world.find_many()
         ]
 
     @db_required
-    async def get_terrain_page(self, page_x, page_z):
-        page = {}
-        for elev in await db.elev.find_many(where={
+    async def get_terrain_arrays(self, page_x, page_z):
+        """Get flat (textures, heights) arrays of a terrain page, indexed by cell"""
+        return decode_page(await db.elev.find_many(where={
                 'wid': self.world_id, 'page_x': page_x, 'page_z': page_z
-            }):
-            width = elev.radius * 2
-            textures = [int(n) for n in elev.textures.split(' ')]
-            heights = [int(n) for n in elev.heights.split(' ')]
-            for i in range(width):
-                row = i * 128
-                for j in range(width):
-                    index = width * i + j
-                    texture = textures[index] if index < len(textures) else textures[0]
-                    height = heights[index] if index < len(heights) else heights[0]
-                    if texture == height == 0:
-                        continue
-                    cell = row + j + elev.node_x + elev.node_z * 128
-                    page[cell] = [texture, height]
-        return page
+            }))
+
+    @db_required
+    async def get_terrain_data(self, page_x, page_z):
+        """Get a packed terrain page, as precomputed at import time when available"""
+        if (terrain := await db.terrain.find_unique(where={
+                'wid_page_x_page_z': {'wid': self.world_id, 'page_x': page_x, 'page_z': page_z}
+            })) is not None:
+            return terrain.data.decode()
+        return pack_page(*await self.get_terrain_arrays(page_x, page_z))
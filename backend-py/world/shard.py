@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""World shard module"""
+
+import time
+import zlib
+from user.model import authorized_users
+from utils.backplane import backplane
+from utils.timer import scheduler
+
+
+class ShardMap:
+    """Worlds assigned to workers, the owner of a world being the only one to tick it
+
+    Worlds go to live workers by rendezvous hashing, so a worker joining or leaving only moves
+    its share of them. Workers share their load with a heartbeat, and one busier than the
+    average by the rebalance factor hands one of its worlds to the least busy worker, which
+    overrides the hashing for that world.
+    """
+    def __init__(self) -> None:
+        # Load of the other workers, by node, and when it was last heard of
+        self._loads = {}
+        self._seen = {}
+        self._overrides = {}
+        self._job = None
+        self.timeout = 0
+        self.factor = 0
+
+    def start(self, heartbeat: float, timeout: float, factor: float) -> None:
+        """Start sharing the load, a factor of 0 disabling rebalancing"""
+        self.timeout = timeout
+        self.factor = factor
+        if self._job is None:
+            self._job = scheduler.schedule(heartbeat, self.heartbeat)
+
+    def stop(self) -> None:
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def nodes(self) -> list:
+        """Get the live workers, this one included"""
+        now = time.monotonic()
+        for node, seen in list(self._seen.items()):
+            if now - seen > self.timeout:
+                del self._seen[node]
+                self._loads.pop(node, None)
+        return [backplane.node, *self._seen]
+
+    def owner(self, world) -> str:
+        """Get the node of the worker owning a world"""
+        nodes = self.nodes()
+        if (node := self._overrides.get(world)) in nodes:
+            return node
+        return max(nodes, key=lambda node: zlib.crc32(f'{node}:{world}'.encode()))
+
+    def owns(self, world) -> bool:
+        """Tell if this worker owns a world, which it always does without a backplane"""
+        return not backplane.active or self.owner(world) == backplane.node
+
+    def load(self) -> dict:
+        """Get the connected users of each world owned by this worker"""
+        return {world: authorized_users.present_count(world)
+                for world in authorized_users.worlds() if self.owns(world)}
+
+    async def heartbeat(self) -> None:
+        """Share the load of this worker, and rebalance it if it is too busy"""
+        load = self.load()
+        overridden = [world for world in load if self._overrides.get(world) == backplane.node]
+        await backplane.publish({'op': 'shard', 'load': list(load.items()),
+                                 'overrides': overridden})
+        if self.factor and (move := self._rebalance(load)) is not None:
+            world, node = move
+            self._overrides[world] = node
+            await backplane.publish({'op': 'shard_move', 'world': world, 'target': node})
+
+    def _rebalance(self, load: dict):
+        total = sum(load.values())
+        self.nodes()
+        loads = {node: sum(self._loads.get(node, {}).values()) for node in self._seen}
+        if not loads or len(load) < 2:
+            return None
+        average = (total + sum(loads.values())) / (len(loads) + 1)
+        if total <= average * self.factor:
+            return None
+        target = min(loads, key=loads.get)
+        # The busiest world that still leaves the target less busy than this worker
+        movable = [world for world, users in load.items() if loads[target] + users < total - users]
+        if not movable:
+            return None
+        return max(movable, key=load.get), target
+
+    def on_heartbeat(self, node: str, load: list, overrides: list) -> None:
+        """Follow the load of another worker"""
+        self._seen[node] = time.monotonic()
+        # Pairs of world and users, world ids not being valid JSON keys
+        self._loads[node] = dict(load)
+        for world in overrides:
+            self._overrides[world] = node
+
+    def on_move(self, world, node: str) -> None:
+        """Follow a world handed to a worker"""
+        self._overrides[world] = node
+
+
+shards = ShardMap()
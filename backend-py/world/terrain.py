@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Terrain module"""
+
+import zlib
+import numpy as np
+
+PAGE_SIZE = 128
+PAGE_CELLS = PAGE_SIZE * PAGE_SIZE
+# Raw page: little-endian int32 textures of all cells, then heights, row by row
+PAGE_MIMETYPE = 'application/vnd.lemuria.terrain'
+
+
+def _decode_values(strings: list, counts: np.ndarray) -> np.ndarray:
+    """Decode the value strings of all nodes at once, padding each node to its cell count
+    with its first value"""
+    values = np.fromstring(' '.join(strings), dtype=np.int32, sep=' ')
+    lengths = np.array([s.count(' ') + 1 for s in strings], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    node_offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.arange(counts.sum()) - np.repeat(node_offsets, counts)
+    positions[positions >= np.repeat(lengths, counts)] = 0
+    return values[np.repeat(starts, counts) + positions]
+
+
+def decode_page(elevs) -> tuple:
+    """Scatter elev nodes into flat texture and height arrays of a whole page, cells
+    overflowing the page are dropped"""
+    textures = np.zeros(PAGE_CELLS, dtype=np.int32)
+    heights = np.zeros(PAGE_CELLS, dtype=np.int32)
+    if not elevs:
+        return textures, heights
+
+    widths = np.array([elev.radius * 2 for elev in elevs], dtype=np.int64)
+    bases = np.array([elev.node_x + elev.node_z * PAGE_SIZE for elev in elevs], dtype=np.int64)
+    counts = widths * widths
+    node_textures = _decode_values([elev.textures for elev in elevs], counts)
+    node_heights = _decode_values([elev.heights for elev in elevs], counts)
+
+    # Position of every value inside its node, then inside the page
+    node_offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.arange(counts.sum()) - np.repeat(node_offsets, counts)
+    cell_widths = np.repeat(widths, counts)
+    cells = (positions // cell_widths * PAGE_SIZE + positions % cell_widths +
+             np.repeat(bases, counts))
+
+    # Empty cells don't override what previous nodes have set, and later nodes win
+    mask = ((node_textures != 0) | (node_heights != 0)) & (cells >= 0) & (cells < PAGE_CELLS)
+    cells = cells[mask][::-1]
+    cells, last = np.unique(cells, return_index=True)
+    textures[cells] = node_textures[mask][::-1][last]
+    heights[cells] = node_heights[mask][::-1][last]
+    return textures, heights
+
+
+def to_sparse(textures: np.ndarray, heights: np.ndarray) -> dict:
+    """Get the {cell: [texture, height]} form of a page, without empty cells"""
+    cells = np.flatnonzero(textures | heights)
+    return {
+        cell: [texture, height]
+        for cell, texture, height in zip(cells.tolist(),
+                                         textures[cells].tolist(),
+                                         heights[cells].tolist())
+    }
+
+
+def pack_page(textures: np.ndarray, heights: np.ndarray) -> bytes:
+    """Pack a page into compressed little-endian int32 textures followed by heights"""
+    return zlib.compress(textures.astype('<i4').tobytes() + heights.astype('<i4').tobytes())
+
+
+def raw_page(data: bytes) -> bytes:
+    """Get the uncompressed content of a packed page"""
+    return zlib.decompress(data)
+
+
+def unpack_page(data: bytes) -> tuple:
+    """Get the flat (textures, heights) arrays of a packed page"""
+    values = np.frombuffer(raw_page(data), dtype='<i4')
+    return values[:PAGE_CELLS], values[PAGE_CELLS:]
@@ -316,6 +316,8 @@ export const importWorld = async (
 
   await db.prop.deleteMany({where: {wid: world.id}})
   await db.elev.deleteMany({where: {wid: world.id}})
+  // Pages precomputed from the previous elevation data
+  await db.terrain.deleteMany({where: {wid: world.id}})
 
   await db.$transaction(async (prisma) => {
     for await (const e of loadElevdump(`${path}/elev${worldName}.txt`)) {
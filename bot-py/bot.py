@@ -49,6 +49,7 @@ class Bot(User):
         self.connected = False
         self.handlers = {}
         self.userlist = {}
+        self.userlist_seq = None
         self.worldlist = {}
         self.cookiejar = {}
 
@@ -85,30 +86,63 @@ class Bot(User):
         elif t == "join":
             await self._callback("on_user_join", msg["data"])
         elif t == "list":
-            self.userlist.clear()
+            previous, self.userlist = self.userlist, {}
             for u in msg["data"]:
-                user = User(u["name"])
-                user.avatar = u["avatar"]
-                user.world = u["world"]
-                self.userlist[u["id"]] = user
+                self._add_user(u, previous.get(u["id"]))
+            self.userlist_seq = msg.get("seq")
+            await self._callback("on_user_list")
+        elif t == "list_diff":
+            if self.userlist_seq is None:
+                # Waiting for a full list
+                return
+            if msg["seq"] != self.userlist_seq + 1:
+                self.userlist_seq = None
+                await self.send({'type': 'list'})
+                return
+            for u in msg["added"] + msg["changed"]:
+                self._add_user(u, self.userlist.get(u["id"]))
+            for user_id in msg["removed"]:
+                self.userlist.pop(user_id, None)
+            self.userlist_seq = msg["seq"]
             await self._callback("on_user_list")
         elif t == "msg":
             await self._callback("on_msg", msg["user"], msg["data"])
         elif t == "part":
             await self._callback("on_user_part", msg["data"])
         elif t == "pos":
-            user = self.userlist.get(msg["user"])
-            if user is not None:
-                data = msg["data"]
-                user.x = data["pos"]["x"]
-                user.y = data["pos"]["y"]
-                user.z = data["pos"]["z"]
-                user.roll = data["ori"]["x"]
-                user.yaw = data["ori"]["y"]
-                user.pitch = data["ori"]["z"]
-                user.state = data["state"]
-                user.gesture = data["gesture"]
-            await self._callback("on_user_pos", msg["user"], msg["data"])
+            await self._update_pos(msg["user"], msg["data"])
+        elif t == "pos_batch":
+            for entry in msg["data"]:
+                await self._update_pos(entry["user"], entry)
+
+    def _add_user(self, data: dict, user: User = None) -> None:
+        # Positions are only sent again when they change, so known users are kept
+        if user is None:
+            user = User()
+        user.name = data["name"]
+        user.avatar = data["avatar"]
+        user.world = data["world"]
+        user.set_position(data["x"], data["y"], data["z"],
+                          data["roll"], data["yaw"], data["pitch"])
+        user.state = data["state"]
+        user.gesture = data["gesture"]
+        self.userlist[data["id"]] = user
+
+    async def _update_pos(self, user_id: str, data: dict) -> None:
+        user = self.userlist.get(user_id)
+        if user is not None:
+            # Batched entries only hold the fields that changed
+            pos = data.get("pos", {})
+            ori = data.get("ori", {})
+            user.x = pos.get("x", user.x)
+            user.y = pos.get("y", user.y)
+            user.z = pos.get("z", user.z)
+            user.roll = ori.get("x", user.roll)
+            user.yaw = ori.get("y", user.yaw)
+            user.pitch = ori.get("z", user.pitch)
+            user.state = data.get("state", user.state)
+            user.gesture = data.get("gesture", user.gesture)
+        await self._callback("on_user_pos", user_id, data)
 
     async def send(self, msg: dict) -> None:
         if self.ws is not None:
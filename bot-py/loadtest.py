@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Load test module, running many bots against a backend and reporting how it copes"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from math import atan2, cos, pi, sin
+from bot import Bot
+
+WEB_URL = 'http://localhost:8080/api/v1'
+WS_URL = 'ws://localhost:8080/api/v1/ws'
+TICK = 0.2
+PING = '!ping'
+
+
+class LoadBot(Bot):
+    """Bot moving by itself, counting what it gets and timing its own chat pings"""
+    def __init__(self, *args, pattern: str = 'wander', speed: float = 1, radius: float = 20,
+                 world: str = None, ping_interval: float = 0, **kwargs) -> None:
+        super().__init__(*args, logging_enabled=False, **kwargs)
+        self.pattern = pattern
+        self.move_speed = speed
+        self.radius = radius
+        self.world_name = world
+        self.ping_interval = ping_interval
+        self.received = Counter()
+        self.sent = 0
+        self.latencies = []
+        self.pings = {}
+        self.tasks = []
+
+    async def _process_msg(self, msg: dict) -> None:
+        self.received[msg.get('type')] += 1
+        if msg.get('type') == 'msg' and isinstance(msg.get('data'), str) \
+                and (sent := self.pings.pop(msg['data'], None)) is not None:
+            self.latencies.append(time.monotonic() - sent)
+        await super()._process_msg(msg)
+
+    async def send(self, msg: dict) -> None:
+        await super().send(msg)
+        self.sent += 1
+
+    async def on_connected(self) -> None:
+        for world_id, world in self.worldlist.items():
+            if self.world_name is None or world['name'] == self.world_name \
+                    or str(world_id) == self.world_name:
+                await self.world_enter(world_id)
+                break
+        await self.send_position()
+        self.tasks.append(asyncio.create_task(self.walk()))
+        if self.ping_interval:
+            self.tasks.append(asyncio.create_task(self.ping()))
+
+    async def on_disconnected(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+    async def move(self, dest_x: float, dest_z: float) -> None:
+        """Walk to a destination, one step per tick as bonobot does"""
+        dx = dest_x - self.x
+        dz = dest_z - self.z
+        steps = max(1, int((dx ** 2 + dz ** 2) ** 0.5 / self.move_speed))
+        self.state = 'walk'
+        direction = atan2(dx, dz) + pi
+        for _ in range(steps):
+            self.set_position(self.x + dx / steps, self.y, self.z + dz / steps, yaw=direction)
+            await self.send_position()
+            await asyncio.sleep(TICK)
+        self.state = 'idle'
+        await self.send_position()
+
+    async def walk(self) -> None:
+        """Move forever following the pattern"""
+        if self.pattern == 'idle':
+            return
+        angle = random.uniform(0, 2 * pi)
+        while True:
+            if self.pattern == 'circle':
+                angle += self.move_speed / self.radius
+                await self.move(self.radius * cos(angle), self.radius * sin(angle))
+            else:
+                await self.move(random.uniform(-self.radius, self.radius),
+                                random.uniform(-self.radius, self.radius))
+                await asyncio.sleep(random.uniform(0, 1))
+
+    async def ping(self) -> None:
+        """Send chat messages to time their round trip through the server"""
+        while True:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.ping_interval)
+            token = f'{PING} {id(self)} {time.monotonic()}'
+            self.pings[token] = time.monotonic()
+            await self.send_msg(token)
+
+
+async def run_bots(index: int, args) -> dict:
+    """Start the bots of a process, spread over the ramp-up, and run them for the duration"""
+    bots = []
+    tasks = []
+    errors = Counter()
+
+    async def start(bot, delay):
+        await asyncio.sleep(delay)
+        try:
+            await bot.connect()
+        except Exception as exc: # pylint: disable=broad-except
+            errors[type(exc).__name__] += 1
+
+    for i in range(args.bots):
+        bot = LoadBot(args.web_url, args.ws_url, pattern=args.pattern, speed=args.speed,
+                      radius=args.radius, world=args.world,
+                      ping_interval=args.ping_interval if i < args.probes else 0)
+        bot.name = f'load{index}-{i}'
+        bots.append(bot)
+        tasks.append(asyncio.create_task(start(bot, args.ramp * i / args.bots)))
+
+    await asyncio.sleep(args.ramp)
+    # Only count what happens once every bot had its chance to connect
+    for bot in bots:
+        bot.received.clear()
+        bot.sent = 0
+        bot.latencies.clear()
+    start_time = time.monotonic()
+    await asyncio.sleep(args.duration)
+    elapsed = time.monotonic() - start_time
+    result = {
+        'connected': sum(bot.connected for bot in bots),
+        'received': sum((bot.received for bot in bots), Counter()),
+        'sent': sum(bot.sent for bot in bots),
+        'latencies': [latency for bot in bots for latency in bot.latencies],
+        'errors': errors,
+        'elapsed': elapsed
+    }
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+
+def process_main(index: int, args, results) -> None:
+    results.put(asyncio.run(run_bots(index, args)))
+
+
+def server_pids(args) -> list:
+    """Get the pids to watch, given or matched on their command line"""
+    pids = list(args.server_pid or [])
+    if args.server_match:
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                with open(f'/proc/{pid}/cmdline', 'rb') as cmdline:
+                    if args.server_match.encode() in cmdline.read():
+                        pids.append(int(pid))
+            except OSError:
+                continue
+    return pids
+
+
+def read_proc(pid: int) -> tuple:
+    """Get the CPU seconds and resident memory in bytes of a process"""
+    with open(f'/proc/{pid}/stat', encoding='utf-8') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    # utime, stime and rss are fields 14, 15 and 24 counting from 1, the state being field 3
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu, int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def sample_server(pids: list, samples: list, previous: dict) -> None:
+    now = time.monotonic()
+    cpu = 0.0
+    rss = 0
+    for pid in pids:
+        try:
+            pid_cpu, pid_rss = read_proc(pid)
+        except OSError:
+            continue
+        last_cpu, last_time = previous.get(pid, (pid_cpu, now))
+        if now > last_time:
+            cpu += (pid_cpu - last_cpu) / (now - last_time)
+        rss += pid_rss
+        previous[pid] = (pid_cpu, now)
+    samples.append((cpu, rss))
+
+
+def percentile(values: list, rank: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * rank))]
+
+
+def report(args, results: list, samples: list) -> None:
+    elapsed = max(result['elapsed'] for result in results)
+    received = sum((result['received'] for result in results), Counter())
+    errors = sum((result['errors'] for result in results), Counter())
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    print(f"bots: {sum(result['connected'] for result in results)} connected "
+          f"of {args.bots * args.processes}" + (f', errors {dict(errors)}' if errors else ''))
+    print(f"sent: {sum(result['sent'] for result in results) / elapsed:.0f} msg/s")
+    print(f'received: {sum(received.values()) / elapsed:.0f} msg/s')
+    for kind, count in received.most_common():
+        print(f'  {kind}: {count / elapsed:.0f} msg/s')
+    if latencies:
+        print(f'chat latency ({len(latencies)} pings): ' + ', '.join(
+            f'p{int(rank * 100)} {percentile(latencies, rank) * 1e3:.1f}ms'
+            for rank in (0.5, 0.9, 0.99)) + f', max {latencies[-1] * 1e3:.1f}ms')
+    if samples:
+        cpus = [cpu for cpu, _ in samples[1:]] or [0]
+        print(f'server cpu: avg {sum(cpus) / len(cpus):.0%}, max {max(cpus):.0%}')
+        print(f'server memory: max {max(rss for _, rss in samples) / 2 ** 20:.0f} MiB')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--web-url', default=WEB_URL)
+    parser.add_argument('--ws-url', default=WS_URL)
+    parser.add_argument('-n', '--bots', type=int, default=100, help='bots per process')
+    parser.add_argument('-p', '--processes', type=int, default=1)
+    parser.add_argument('-d', '--duration', type=float, default=30, help='seconds measured')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds to connect the bots')
+    parser.add_argument('--world', help='world name or id, the first one by default')
+    parser.add_argument('--pattern', choices=('idle', 'wander', 'circle'), default='wander')
+    parser.add_argument('--speed', type=float, default=1, help='distance per step')
+    parser.add_argument('--radius', type=float, default=20, help='area walked by the bots')
+    parser.add_argument('--probes', type=int, default=5,
+                        help='bots per process timing chat pings')
+    parser.add_argument('--ping-interval', type=float, default=2)
+    parser.add_argument('--server-pid', type=int, action='append', help='server pid to watch')
+    parser.add_argument('--server-match', help='watch processes with this in their command line')
+    args = parser.parse_args()
+
+    # Before the bots start, forked with the same command line as this process
+    pids = server_pids(args)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=process_main, args=(index, args, results))
+                 for index in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    samples = []
+    previous = {}
+    time.sleep(args.ramp)
+    end = time.monotonic() + args.duration
+    while pids and time.monotonic() < end:
+        sample_server(pids, samples, previous)
+        time.sleep(1)
+
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    report(args, collected, samples)
+
+
+if __name__ == '__main__':
+    main()